@@ -0,0 +1,162 @@
+import hashlib
+import json
+import os
+import zlib
+from datetime import datetime
+import metrics
+from metrics import BYTES_READ, BYTES_WRITTEN
+from storage import FileLock
+
+# Los trozos terminan en fin de línea: tras MIN_CHUNK_BYTES se corta en la primera
+# línea cuyo crc32 cumple la máscara (en promedio cada 1024 líneas), y siempre
+# antes de MAX_CHUNK_BYTES. Como el corte depende del contenido y no de la
+# posición, cambiar o añadir unas líneas solo altera los trozos que las contienen.
+MIN_CHUNK_BYTES = 16 * 1024
+MAX_CHUNK_BYTES = 1024 * 1024
+CHUNK_BOUNDARY_MASK = 0x3FF
+# Líneas más largas (p. ej. en archivos binarios) se leen en partes de este tamaño
+MAX_LINE_BYTES = 64 * 1024
+COMPRESSION_LEVEL = 6
+# Copias que se conservan al depurar; los trozos que ninguna usa se borran
+BACKUP_KEEP = 48
+SNAPSHOT_ID_FORMAT = '%Y-%m-%d_%H-%M-%S'
+
+def iter_chunks(f, limit=None):
+    """Divide el archivo binario f (o sus primeros limit bytes) en trozos definidos por su contenido."""
+    pending = []
+    size = 0
+    remaining = limit
+    while remaining is None or remaining > 0:
+        line = f.readline(MAX_LINE_BYTES if remaining is None else min(MAX_LINE_BYTES, remaining))
+        if not line:
+            break
+        if remaining is not None:
+            remaining -= len(line)
+        pending.append(line)
+        size += len(line)
+        if size >= MAX_CHUNK_BYTES or (size >= MIN_CHUNK_BYTES and zlib.crc32(line) & CHUNK_BOUNDARY_MASK == 0):
+            yield b''.join(pending)
+            pending = []
+            size = 0
+    if pending:
+        yield b''.join(pending)
+
+def _file_signature(st):
+    return [st.st_size, st.st_mtime_ns]
+
+class BackupRepository:
+    """Copias de seguridad incrementales en una carpeta.
+
+    Cada archivo se guarda como una lista de trozos comprimidos con zlib y
+    nombrados por el SHA-256 de su contenido, así que un trozo que ya está en
+    alguna copia anterior no se vuelve a escribir. Un archivo que no cambió
+    desde la última copia (mismo tamaño y fecha) ni siquiera se lee. Cada copia
+    es un manifiesto JSON en snapshots/ con los trozos de inventario, ventas y
+    configuración tomados en el mismo instante.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.chunks_dir = os.path.join(path, 'chunks')
+        self.snapshots_dir = os.path.join(path, 'snapshots')
+        os.makedirs(self.chunks_dir, exist_ok=True)
+        os.makedirs(self.snapshots_dir, exist_ok=True)
+        self._lock = FileLock(os.path.join(path, 'copias.lock'))
+
+    def _chunk_path(self, digest):
+        return os.path.join(self.chunks_dir, digest[:2], digest)
+
+    def _store_chunk(self, data):
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._chunk_path(digest)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            compressed = zlib.compress(data, COMPRESSION_LEVEL)
+            tmp_path = path + '.tmp'
+            with open(tmp_path, 'wb') as f:
+                f.write(compressed)
+            os.replace(tmp_path, path)
+            metrics.count(BYTES_WRITTEN, len(compressed))
+        return [digest, len(data)]
+
+    def _read_chunk(self, digest):
+        with open(self._chunk_path(digest), 'rb') as f:
+            data = zlib.decompress(f.read())
+        if hashlib.sha256(data).hexdigest() != digest:
+            raise ValueError(f"Trozo dañado en la copia de seguridad: {digest}")
+        return data
+
+    def _backup_file(self, path, st, previous):
+        # Se respaldan solo los st_size bytes anotados: al diario de ventas se le
+        # pueden haber añadido líneas desde entonces
+        signature = _file_signature(st)
+        if previous is not None and previous['signature'] == signature:
+            return previous
+        with open(path, 'rb') as f:
+            chunks = [self._store_chunk(data) for data in iter_chunks(f, st.st_size)]
+        metrics.count(BYTES_READ, signature[0])
+        return {'signature': signature, 'size': sum(size for _, size in chunks), 'chunks': chunks}
+
+    def snapshots(self):
+        """Identificadores de las copias, de la más antigua a la más reciente."""
+        return sorted(name[:-len('.json')] for name in os.listdir(self.snapshots_dir) if name.endswith('.json'))
+
+    def manifest(self, snapshot_id):
+        with open(os.path.join(self.snapshots_dir, snapshot_id + '.json'), 'r') as f:
+            return json.load(f)
+
+    def _new_snapshot_id(self):
+        base = datetime.now().strftime(SNAPSHOT_ID_FORMAT)
+        snapshot_id, n = base, 1
+        while os.path.exists(os.path.join(self.snapshots_dir, snapshot_id + '.json')):
+            n += 1
+            snapshot_id = f'{base}_{n}'
+        return snapshot_id
+
+    @metrics.traced('backup')
+    def create(self, storage):
+        """Copia los datos de storage; devuelve el identificador de la copia."""
+        with self._lock:
+            existing = self.snapshots()
+            previous = self.manifest(existing[-1])['files'] if existing else {}
+            with storage.backup_sources() as sources:
+                files = {name: self._backup_file(path, st, previous.get(name)) for name, (path, st) in sources.items()}
+            snapshot_id = self._new_snapshot_id()
+            path = os.path.join(self.snapshots_dir, snapshot_id + '.json')
+            with open(path + '.tmp', 'w') as f:
+                json.dump({'fecha': datetime.now().isoformat(timespec='seconds'),
+                           'almacenamiento': type(storage).__name__, 'files': files}, f)
+            os.replace(path + '.tmp', path)
+            return snapshot_id
+
+    def restore(self, storage, snapshot_id):
+        """Devuelve inventario, ventas y configuración al estado de la copia indicada."""
+        with self._lock:
+            manifest = self.manifest(snapshot_id)
+            if manifest['almacenamiento'] != type(storage).__name__:
+                raise ValueError("La copia es de otro tipo de almacenamiento.")
+            # Se comprueba que estén todos los trozos antes de tocar los datos
+            for entry in manifest['files'].values():
+                for digest, _ in entry['chunks']:
+                    if not os.path.exists(self._chunk_path(digest)):
+                        raise ValueError(f"Falta un trozo de la copia {snapshot_id}: {digest}")
+            storage.restore_files({
+                name: (self._read_chunk(digest) for digest, _ in entry['chunks'])
+                for name, entry in manifest['files'].items()
+            })
+
+    def prune(self, keep=BACKUP_KEEP):
+        """Borra las copias más antiguas que las últimas keep y los trozos que ya nadie usa."""
+        with self._lock:
+            existing = self.snapshots()
+            for snapshot_id in existing[:-keep]:
+                os.remove(os.path.join(self.snapshots_dir, snapshot_id + '.json'))
+            used = set()
+            for snapshot_id in existing[-keep:]:
+                for entry in self.manifest(snapshot_id)['files'].values():
+                    used.update(digest for digest, _ in entry['chunks'])
+            for prefix in os.listdir(self.chunks_dir):
+                directory = os.path.join(self.chunks_dir, prefix)
+                for digest in os.listdir(directory):
+                    if digest not in used:
+                        os.remove(os.path.join(directory, digest))
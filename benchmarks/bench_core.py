@@ -0,0 +1,314 @@
+"""Benchmarks de la capa de datos, sin interfaz gráfica.
+
+Genera catálogos e historiales de ventas sintéticos en una carpeta temporal y
+mide carga, búsqueda, lectura por código, venta, ventas simultáneas desde
+varias terminales, recálculo de precios, informes y reposición. Los resultados
+se guardan en JSON para compararlos entre versiones:
+
+    python benchmarks/bench_core.py --output base.json
+    python benchmarks/bench_core.py --output nuevo.json --compare base.json
+
+Con --quick se usan tamaños pequeños (útil para comprobar que todo funciona).
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core import InventoryStore
+from pricing import PricingRules, reprice
+from reports import sales_report
+from replenishment import ReorderPolicy, ReplenishmentEngine
+from storage import CsvStorage, SqliteStorage, SALES_COLUMNS, import_csv_data
+
+WORDS = np.array([
+    'VINILO', 'MARFIL', 'ACRÍLICO', 'CUADERNO', 'COSIDO', 'COLORES', 'CARTULINA', 'BRISTOL',
+    'TEMPERA', 'LÁPIZ', 'ROJO', 'AZUL', 'VERDE', 'NEGRO', 'SURTIDO', 'FAMA', 'TRIANGULAR',
+    'SHARPIE', 'PERMANENTE', 'CARTÓN', 'PAÑO', 'BLANCO', 'ECONÓMICO', 'LARGO', 'PLUS',
+])
+QUERIES = ['a', 'vi', 'lap', 'carton', 'lapiz rojo', 'colores triangular 12', '12345', 'zzz']
+TYPING_SEQUENCE = ['c', 'ca', 'car', 'cart', 'carto', 'carton', 'carton b', 'carton bl']
+
+DEFAULT_SIZES = [1_000, 100_000, 1_000_000]
+DEFAULT_SALES_ROWS = 10_000_000
+DEFAULT_SALES_PRODUCTS = 10_000
+# Un resultado más lento que la referencia en este factor se considera una regresión
+DEFAULT_THRESHOLD = 1.3
+SALES_CHUNK_ROWS = 1_000_000
+DEFAULT_TERMINALS = [1, 2, 4]
+TERMINAL_CATALOG = 1_000
+TERMINAL_SALES = 50
+
+def synthetic_catalog(n, seed=0):
+    """Catálogo de n productos; el 80 % sigue el incremento general."""
+    rng = np.random.default_rng(seed)
+    words = rng.choice(WORDS, size=(n, 4))
+    names = pd.Series(words[:, 0]).str.cat(
+        [words[:, 1], words[:, 2], words[:, 3], rng.integers(1, 1000, n).astype(str)], sep=' ')
+    markups = np.where(rng.random(n) < 0.8, np.nan, 30.0)
+    return pd.DataFrame({
+        'id_producto': np.arange(1, n + 1),
+        'nombre': names,
+        'precio': rng.integers(100, 50_000, n).astype(float),
+        'stock': rng.integers(10, 500, n),
+        'precio_venta': np.nan,
+        'porcentaje_incremento': markups,
+    })
+
+def write_synthetic_sales(path, rows, catalog, days=365, seed=1):
+    """Escribe un historial de ventas de rows líneas repartidas en los últimos days días."""
+    rng = np.random.default_rng(seed)
+    today = date.today()
+    dates = np.array([(today - timedelta(days=d)).isoformat() for d in range(days)][::-1])
+    names = catalog['nombre'].to_numpy()
+    prices = catalog['precio'].to_numpy() * 1.3
+    header = True
+    for start in range(0, rows, SALES_CHUNK_ROWS):
+        size = min(SALES_CHUNK_ROWS, rows - start)
+        day = np.sort(rng.integers(0, days, size))
+        product = rng.integers(0, len(catalog), size)
+        quantity = rng.integers(1, 6, size)
+        chunk = pd.DataFrame({
+            'fecha': dates[day],
+            'id_producto': product + 1,
+            'nombre': names[product],
+            'cantidad': quantity,
+            'total': np.round(prices[product] * quantity, 2),
+        })[SALES_COLUMNS]
+        chunk.to_csv(path, mode='w' if header else 'a', header=header, index=False)
+        header = False
+
+def make_storage(data_dir, backend):
+    """Crea el almacenamiento del backend pedido a partir de los CSV de data_dir."""
+    csv_storage = CsvStorage(data_dir)
+    if backend == 'csv':
+        return csv_storage
+    sqlite_storage = SqliteStorage(os.path.join(data_dir, 'inventario.db'))
+    import_csv_data(csv_storage, sqlite_storage)
+    return sqlite_storage
+
+def timed(fn, repeat=1):
+    """Ejecuta fn repeat veces; devuelve la mediana en segundos."""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples)
+
+class Recorder:
+    def __init__(self, backend):
+        self.backend = backend
+        self.results = []
+
+    def add(self, name, size, seconds, repeat=1):
+        self.results.append({
+            'benchmark': name, 'size': size, 'backend': self.backend,
+            'seconds': seconds, 'repeat': repeat,
+        })
+        print(f"{name:<30} {size:>12,} {seconds * 1000:>12.3f} ms", flush=True)
+
+def bench_catalog(recorder, n, backend, workdir):
+    """Carga, búsqueda, lectura por código, venta y recálculo sobre un catálogo de n productos."""
+    data_dir = os.path.join(workdir, f'catalogo_{n}')
+    os.makedirs(data_dir)
+    rules = PricingRules(30)
+    synthetic_catalog(n).to_csv(os.path.join(data_dir, 'inventario.csv'), index=False)
+    pd.DataFrame({'parametro': ['porcentaje_incremento'], 'valor': [30]}).to_csv(
+        os.path.join(data_dir, 'config.csv'), index=False)
+    pd.DataFrame(columns=SALES_COLUMNS).to_csv(os.path.join(data_dir, 'sales.csv'), index=False)
+    storage = make_storage(data_dir, backend)
+
+    store = InventoryStore(storage, lambda: rules)
+    recorder.add('load_inventory', n, timed(store.dataframe))
+    # Segundo arranque: con CSV se lee la instantánea binaria que dejó la primera carga
+    recorder.add('load_inventory_restart', n, timed(InventoryStore(storage, lambda: rules).dataframe))
+    recorder.add('build_search_index', n, timed(store.search_index))
+
+    index = store.search_index()
+    for query in QUERIES:
+        def search():
+            index.clear_cache()
+            index.search(query)
+        recorder.add(f'search[{query}]', n, timed(search, repeat=5), repeat=5)
+
+    def typing():
+        index.clear_cache()
+        for query in TYPING_SEQUENCE:
+            index.search(query)
+    recorder.add('search_as_you_type', n, timed(typing, repeat=5) / len(TYPING_SEQUENCE), repeat=5)
+
+    rng = np.random.default_rng(2)
+    codes = [str(c) for c in rng.integers(1, n + 1, 1000)]
+    def lookups():
+        for code in codes:
+            store.lookup_code(code)
+    recorder.add('scan_lookup', n, timed(lookups, repeat=3) / len(codes), repeat=3)
+
+    fecha = datetime.now().strftime('%Y-%m-%d')
+    carts = [{str(pid): 1 for pid in rng.integers(1, n + 1, 5)} for _ in range(10)]
+    cart_iter = iter(carts)
+    recorder.add('checkout_5_items', n, timed(lambda: store.sell(next(cart_iter), fecha), repeat=len(carts)),
+                 repeat=len(carts))
+
+    df = store.dataframe()
+    new_rules = PricingRules(35)
+    recorder.add('reprice_preview', n, timed(lambda: store.reprice_preview(rules, new_rules)))
+    recorder.add('reprice_global_markup', n, timed(lambda: reprice(df, rules, new_rules)))
+    # Recalcular y guardar los precios que cambian (lo que hace la aplicación al confirmar)
+    recorder.add('reprice_commit', n, timed(lambda: store.reprice(new_rules, PricingRules(40))))
+
+def bench_sales(recorder, rows, products, backend, workdir):
+    """Informes y ventas sobre un historial de rows líneas."""
+    data_dir = os.path.join(workdir, f'ventas_{rows}')
+    os.makedirs(data_dir)
+    catalog = synthetic_catalog(products)
+    catalog.to_csv(os.path.join(data_dir, 'inventario.csv'), index=False)
+    write_synthetic_sales(os.path.join(data_dir, 'sales.csv'), rows, catalog)
+    storage = make_storage(data_dir, backend)
+
+    today = date.today()
+    year_ago = (today - timedelta(days=364)).isoformat()
+    recorder.add('report_year_cold', rows, timed(lambda: sales_report(storage, year_ago, today.isoformat())))
+    recorder.add('report_year', rows, timed(lambda: sales_report(storage, year_ago, today.isoformat()), repeat=3),
+                 repeat=3)
+    recorder.add('report_day', rows, timed(lambda: sales_report(storage, today.isoformat(), today.isoformat()),
+                                           repeat=3), repeat=3)
+
+    store = InventoryStore(storage, lambda: PricingRules(30))
+    store.dataframe()
+    engine = ReplenishmentEngine(store, ReorderPolicy)
+    recorder.add('replenishment_seed', rows, timed(engine.velocities))
+    recorder.add('replenishment_low_stock', rows, timed(engine.low_stock, repeat=3), repeat=3)
+    fecha = today.isoformat()
+    rng = np.random.default_rng(3)
+    carts = [{str(pid): 1 for pid in rng.integers(1, products + 1, 5)} for _ in range(10)]
+    cart_iter = iter(carts)
+    recorder.add('checkout_with_history', rows, timed(lambda: store.sell(next(cart_iter), fecha),
+                                                      repeat=len(carts)), repeat=len(carts))
+
+def _terminal_worker(data_dir, backend, sales, seed):
+    """Una terminal: vende sales carritos de una unidad; devuelve las unidades vendidas."""
+    storage = CsvStorage(data_dir) if backend == 'csv' else SqliteStorage(os.path.join(data_dir, 'inventario.db'))
+    store = InventoryStore(storage, lambda: PricingRules(30))
+    rng = np.random.default_rng(seed)
+    fecha = date.today().isoformat()
+    sold = 0
+    for pid in rng.integers(1, TERMINAL_CATALOG + 1, sales):
+        try:
+            store.sell({str(pid): 1}, fecha)
+            sold += 1
+        except ValueError:
+            pass
+    return sold
+
+def bench_terminals(recorder, terminals, backend, workdir):
+    """Ventas simultáneas desde varios procesos sobre la misma carpeta de datos.
+
+    Comprueba además que el stock descontado coincide con las unidades vendidas.
+    """
+    data_dir = os.path.join(workdir, f'terminales_{terminals}')
+    os.makedirs(data_dir)
+    synthetic_catalog(TERMINAL_CATALOG).to_csv(os.path.join(data_dir, 'inventario.csv'), index=False)
+    pd.DataFrame(columns=SALES_COLUMNS).to_csv(os.path.join(data_dir, 'sales.csv'), index=False)
+    storage = make_storage(data_dir, backend)
+    stock_before = int(storage.load_inventory()['stock'].sum())
+
+    start = time.perf_counter()
+    with multiprocessing.Pool(terminals) as pool:
+        sold = sum(pool.starmap(_terminal_worker, [(data_dir, backend, TERMINAL_SALES, seed)
+                                                   for seed in range(terminals)]))
+    seconds = time.perf_counter() - start
+
+    stock_after = int(storage.load_inventory()['stock'].sum())
+    if stock_before - stock_after != sold or len(storage.load_sales()) != sold:
+        raise AssertionError(f"Ventas perdidas con {terminals} terminales: "
+                             f"{sold} vendidas, {stock_before - stock_after} descontadas")
+    recorder.add(f'checkout_terminals[{terminals}]', sold, seconds / max(sold, 1))
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)),
+            stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(results, baseline_path, threshold):
+    """Compara con un JSON anterior; devuelve la lista de regresiones."""
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    previous = {(r['benchmark'], r['size'], r['backend']): r['seconds'] for r in baseline['results']}
+    regressions = []
+    print(f"\nComparación con {baseline_path} (revisión {baseline['meta'].get('revision')}):")
+    for r in results:
+        key = (r['benchmark'], r['size'], r['backend'])
+        if key not in previous or previous[key] <= 0:
+            continue
+        ratio = r['seconds'] / previous[key]
+        flag = '  REGRESIÓN' if ratio > threshold else ''
+        print(f"{r['benchmark']:<30} {r['size']:>12,} {ratio:>8.2f}x{flag}")
+        if ratio > threshold:
+            regressions.append((key, ratio))
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default=','.join(str(n) for n in DEFAULT_SIZES),
+                        help='tamaños de catálogo separados por comas')
+    parser.add_argument('--sales-rows', type=int, default=DEFAULT_SALES_ROWS)
+    parser.add_argument('--sales-products', type=int, default=DEFAULT_SALES_PRODUCTS)
+    parser.add_argument('--terminals', default=','.join(str(n) for n in DEFAULT_TERMINALS),
+                        help='cantidades de terminales simultáneas separadas por comas')
+    parser.add_argument('--backend', choices=['csv', 'sqlite'], default='csv')
+    parser.add_argument('--quick', action='store_true', help='catálogos de 1k y 10k y 100k ventas')
+    parser.add_argument('--output', help='archivo JSON de resultados')
+    parser.add_argument('--compare', help='JSON de una ejecución anterior para detectar regresiones')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD)
+    args = parser.parse_args(argv)
+
+    sizes = [1_000, 10_000] if args.quick else [int(n) for n in args.sizes.split(',')]
+    sales_rows = 100_000 if args.quick else args.sales_rows
+    sales_products = min(args.sales_products, 1_000) if args.quick else args.sales_products
+    terminals = [int(n) for n in args.terminals.split(',') if n]
+
+    recorder = Recorder(args.backend)
+    with tempfile.TemporaryDirectory() as workdir:
+        for n in sizes:
+            bench_catalog(recorder, n, args.backend, workdir)
+        for count in terminals:
+            bench_terminals(recorder, count, args.backend, workdir)
+        if sales_rows:
+            bench_sales(recorder, sales_rows, sales_products, args.backend, workdir)
+
+    output = {
+        'meta': {
+            'revision': git_revision(),
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'pandas': pd.__version__,
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+        },
+        'results': recorder.results,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(output, f, indent=2)
+    if args.compare and compare(recorder.results, args.compare, args.threshold):
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
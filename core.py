@@ -0,0 +1,526 @@
+import re
+import threading
+import unicodedata
+import numpy as np
+import pandas as pd
+import metrics
+from storage import (INVENTORY_COLUMNS, INVENTORY_DTYPES, OPTIONAL_INVENTORY_COLUMNS, PRICE_COLUMNS,
+                     compact_inventory, to_cents, typed_inventory)
+from pricing import apply_prices, price_diff, reprice
+
+_COMBINING_MARKS = re.compile('[\u0300-\u036f]')
+
+def normalize_text(text):
+    """Pasa un texto a minúsculas y sin tildes para comparar búsquedas."""
+    text = str(text).casefold()
+    if text.isascii():
+        return text
+    return _COMBINING_MARKS.sub('', unicodedata.normalize('NFKD', text))
+
+@metrics.traced('load_inventory')
+def load_inventory(storage, rules):
+    """Carga el inventario desde el almacenamiento, ajustando precios."""
+    df = storage.load_inventory()
+    for column in INVENTORY_COLUMNS:
+        if column not in df.columns:
+            # Sin incremento propio, el producto sigue las reglas generales
+            df[column] = np.nan if column == 'porcentaje_incremento' else 0
+    return apply_prices(df, rules)
+
+def add_categories(df, column, values):
+    """Agrega a una columna categórica los valores que aún no están entre sus categorías."""
+    if not isinstance(df[column].dtype, pd.CategoricalDtype):
+        return
+    values = pd.Index(pd.Series(values).dropna().unique())
+    missing = values.difference(df[column].cat.categories)
+    if len(missing):
+        df[column] = df[column].cat.add_categories(missing)
+
+def append_products(df, rows):
+    """Concatena filas nuevas (ya en centavos) al inventario conservando los tipos compactos."""
+    rows = compact_inventory(rows.copy())
+    for column in PRICE_COLUMNS:
+        if column not in rows.columns:
+            rows[column] = 0
+    for column in df.columns:
+        if isinstance(df[column].dtype, pd.CategoricalDtype) and column in rows.columns:
+            add_categories(df, column, rows[column])
+            rows[column] = pd.Categorical(rows[column], categories=df[column].cat.categories)
+    return compact_inventory(pd.concat([df, rows], ignore_index=True))
+
+class SearchIndex:
+    """Índice de trigramas sobre nombre e id_producto para buscar mientras se escribe.
+
+    Los textos normalizados se guardan en UTF-8 (un byte por letra sin tilde) y
+    los trigramas son de bytes, lo que equivale a buscar la subcadena en el texto.
+    Las búsquedas devuelven posiciones de fila del DataFrame con el que se construyó.
+    Si la consulta amplía la anterior, solo se filtran los resultados previos.
+    """
+
+    SEPARATOR = '\n'
+
+    def __init__(self, df):
+        names = df['nombre']
+        if isinstance(names.dtype, pd.CategoricalDtype):
+            # Con nombres categóricos basta normalizar una vez cada nombre distinto;
+            # el código -1 (nombre vacío) toma el último elemento
+            categories = np.append(self._normalize(pd.Series(names.cat.categories)), b'')
+            self._names = categories[names.cat.codes.to_numpy()]
+        else:
+            self._names = self._normalize(names)
+        self._ids = np.array(df['id_producto'].astype(str).tolist(), dtype=bytes)
+        self._all_rows = np.arange(len(df), dtype=np.int32)
+        self._build_trigrams()
+        self.clear_cache()
+
+    def clear_cache(self):
+        """Olvida la consulta anterior y los resultados recordados (la próxima búsqueda parte de cero)."""
+        self._last_query = None
+        self._last_rows = self._all_rows
+        self._short_results = {}
+
+    def _normalize(self, names):
+        names = names.fillna('').astype(str).str.replace(self.SEPARATOR, ' ', regex=False)
+        if not len(names):
+            return np.empty(0, dtype=bytes)
+        # Normalizar todo el catálogo de una vez es mucho más rápido que nombre a nombre
+        text = normalize_text(self.SEPARATOR.join(names)).encode('utf-8')
+        return np.array(text.split(self.SEPARATOR.encode()), dtype=bytes)
+
+    def _build_trigrams(self):
+        separator = self.SEPARATOR.encode()
+        parts = []
+        for name, pid in zip(self._names.tolist(), self._ids.tolist()):
+            parts.append(name)
+            parts.append(pid)
+        text = separator.join(parts) + separator
+        codes = np.frombuffer(text, dtype=np.uint8).astype(np.uint32)
+        lengths = np.char.str_len(self._names) + np.char.str_len(self._ids) + 2
+        row_of_char = np.repeat(self._all_rows, lengths)
+        sep = ord(separator)
+        valid = (codes[:-2] != sep) & (codes[1:-1] != sep) & (codes[2:] != sep)
+        if not valid.any():
+            # Ningún nombre ni id tiene tres caracteres
+            self._gram_keys = np.empty(0, dtype=np.uint32)
+            self._gram_starts = np.zeros(1, dtype=np.int64)
+            self._gram_rows = np.empty(0, dtype=np.int32)
+            return
+        grams = ((codes[:-2] << 16) | (codes[1:-1] << 8) | codes[2:])[valid]
+        rows = row_of_char[:-2][valid]
+        # Ordenar la clave (trigrama, fila) deja las filas ascendentes dentro de cada trigrama
+        pairs = (grams.astype(np.uint64) << np.uint64(32)) | rows.astype(np.uint64)
+        del grams, rows
+        pairs.sort()
+        keep = np.ones(len(pairs), dtype=bool)
+        keep[1:] = pairs[1:] != pairs[:-1]
+        pairs = pairs[keep]
+        grams = (pairs >> np.uint64(32)).astype(np.uint32)
+        self._gram_rows = (pairs & np.uint64(0xFFFFFFFF)).astype(np.int32)
+        starts = np.flatnonzero(np.concatenate(([True], grams[1:] != grams[:-1])))
+        self._gram_keys = grams[starts]
+        self._gram_starts = np.append(starts, len(grams)).astype(np.int64)
+
+    def _postings(self, gram):
+        code = (gram[0] << 16) | (gram[1] << 8) | gram[2]
+        pos = np.searchsorted(self._gram_keys, np.uint32(code))
+        if pos == len(self._gram_keys) or self._gram_keys[pos] != code:
+            return self._gram_rows[:0]
+        return self._gram_rows[self._gram_starts[pos]:self._gram_starts[pos + 1]]
+
+    def _candidates(self, query):
+        if len(query) < 3:
+            return self._all_rows
+        postings = sorted((self._postings(query[i:i + 3]) for i in range(len(query) - 2)), key=len)
+        rows = postings[0]
+        for other in postings[1:]:
+            if len(rows) == 0:
+                break
+            rows = np.intersect1d(rows, other, assume_unique=True)
+        return rows
+
+    def _filter(self, rows, query):
+        if len(rows) == 0:
+            return rows
+        matches = (np.char.find(self._names[rows], query) >= 0) | (np.char.find(self._ids[rows], query) >= 0)
+        return rows[matches]
+
+    @metrics.traced('search')
+    def search(self, query):
+        """Devuelve las posiciones de fila cuyo nombre o id contienen la consulta."""
+        query = normalize_text(query).strip().encode('utf-8')
+        if not query:
+            rows = self._all_rows
+        elif query in self._short_results:
+            rows = self._short_results[query]
+        elif self._last_query and self._last_query in query:
+            rows = self._filter(self._last_rows, query)
+        elif len(query) == 3:
+            rows = self._candidates(query)
+        else:
+            rows = self._filter(self._candidates(query), query)
+        if 0 < len(query) < 3:
+            # Las consultas de uno o dos bytes no usan trigramas; se recuerdan
+            self._short_results[query] = rows
+        self._last_query = query
+        self._last_rows = rows
+        return rows
+
+class InventoryStore:
+    """Inventario en memoria compartido por toda la aplicación.
+
+    Lee el inventario una sola vez y mantiene índices (tablas hash de pandas, sin
+    objetos Python por fila) de id_producto y código de barras a posición de
+    fila. Se invalida cuando cambia la versión del almacenamiento (otro proceso
+    lo modificó) o cuando la propia aplicación guarda el inventario. Todas las
+    operaciones toman un candado, ya que se llaman desde los hilos de E/S; solo
+    cached_get y cached_lookup_code, pensadas para el hilo de la interfaz, leen
+    sin candado la última versión publicada.
+
+    Las que modifican el inventario toman además storage.lock(), compartido con
+    las demás terminales, y trabajan sobre la versión vigente en disco; así dos
+    cajas no pisan sus descuentos de stock ni venden más de lo que queda.
+
+    pricing_rules es una función sin argumentos que devuelve las PricingRules
+    vigentes; no depende de Qt, así que sirve también sin interfaz gráfica.
+    """
+
+    def __init__(self, storage, pricing_rules):
+        self.storage = storage
+        self.pricing_rules = pricing_rules
+        self._lock = threading.RLock()
+        self._df = None
+        self._ids = pd.Index([])
+        self._id_rows = np.empty(0, dtype=np.int64)
+        self._barcodes = pd.Index([])
+        self._barcode_rows = np.empty(0, dtype=np.int64)
+        # (inventario, ids, filas, códigos, filas) de la última carga; se reemplaza
+        # entero en cada _set, así que se puede leer sin candado
+        self._published = None
+        self._version = None
+        self._search_index = None
+        self._sale_listeners = []
+        self._reload_listeners = []
+
+    def add_sale_listener(self, listener):
+        """Registra listener(líneas_de_venta), llamado tras guardar cada venta."""
+        self._sale_listeners.append(listener)
+
+    def add_reload_listener(self, listener):
+        """Registra listener(), llamado cada vez que el inventario se vuelve a leer del almacenamiento."""
+        self._reload_listeners.append(listener)
+
+    def sales_lock(self):
+        """Candado para leer del almacenamiento datos de ventas coherentes con los listeners de venta.
+
+        sell lo mantiene desde que guarda la venta hasta que avisa a los
+        listeners, así que lo leído con él tomado incluye cada venta de esta
+        terminal solo si los listeners ya la recibieron. No toma el candado del
+        inventario, que sigue libre para búsquedas y recargas.
+        """
+        return self.storage.lock()
+
+    def _set(self, df, version, catalog_changed=True):
+        df = df.reset_index(drop=True)
+        if catalog_changed or self._df is None:
+            if self._search_index is not None and not self._same_catalog(df):
+                self._search_index = None
+            # Ante ids o códigos repetidos gana la última fila
+            ids = df['id_producto']
+            self._ids = pd.Index(ids[~ids.duplicated(keep='last')])
+            self._id_rows = np.flatnonzero(~ids.duplicated(keep='last').to_numpy())
+            if 'codigo_barras' in df.columns:
+                codes = df['codigo_barras'].dropna().astype(str).str.strip()
+                codes = codes[~codes.duplicated(keep='last')]
+                self._barcodes = pd.Index(codes.to_numpy())
+                self._barcode_rows = codes.index.to_numpy()
+            else:
+                self._barcodes = pd.Index([])
+                self._barcode_rows = np.empty(0, dtype=np.int64)
+        self._df = df
+        self._version = version
+        # Las tablas hash de los índices se crean en la primera búsqueda; se crean
+        # aquí para que el hilo de la interfaz nunca las construya
+        for index in (self._ids, self._barcodes):
+            index.get_indexer(index[:1])
+        self._published = (df, self._ids, self._id_rows, self._barcodes, self._barcode_rows)
+
+    @staticmethod
+    def _find(index, rows, key):
+        try:
+            return int(rows[index.get_loc(key)])
+        except (KeyError, TypeError):
+            return None
+
+    @classmethod
+    def _lookup(cls, published, code):
+        df, ids, id_rows, barcodes, barcode_rows = published
+        code = str(code).strip()
+        pos = cls._find(barcodes, barcode_rows, code)
+        if pos is None and code.isdigit() and str(int(code)) == code:
+            pos = cls._find(ids, id_rows, int(code))
+        if pos is None:
+            return None
+        return df.iloc[pos]
+
+    def _same_catalog(self, df):
+        return (self._df is not None
+                and self._df['id_producto'].equals(df['id_producto'])
+                and self._df['nombre'].equals(df['nombre']))
+
+    def invalidate(self):
+        """Descarta la copia en memoria; la próxima lectura vuelve al disco."""
+        with self._lock:
+            self._df = None
+            self._ids = pd.Index([])
+            self._barcodes = pd.Index([])
+            self._version = None
+            self._search_index = None
+
+    def dataframe(self):
+        """Devuelve el inventario en memoria, recargándolo solo si el almacenamiento cambió."""
+        with self._lock:
+            version = self.storage.inventory_version()
+            if self._df is None or version != self._version:
+                self._set(load_inventory(self.storage, self.pricing_rules()), version)
+                for listener in self._reload_listeners:
+                    listener()
+            return self._df
+
+    def search_index(self):
+        """Devuelve el índice de búsqueda, reconstruyéndolo solo si cambiaron nombres o ids."""
+        with self._lock:
+            self.dataframe()
+            if self._search_index is None:
+                self._search_index = SearchIndex(self._df)
+            return self._search_index
+
+    def search(self, query):
+        """Devuelve (inventario, posiciones de fila) que coinciden con la consulta."""
+        with self._lock:
+            rows = self.search_index().search(query)
+            return self._df, rows
+
+    def position(self, product_id):
+        """Devuelve la posición de fila de un producto o None si no existe."""
+        with self._lock:
+            self.dataframe()
+            return self._find(self._ids, self._id_rows, int(product_id))
+
+    def get(self, product_id):
+        """Devuelve la fila de un producto o None si no existe."""
+        with self._lock:
+            pos = self.position(product_id)
+            if pos is None:
+                return None
+            return self._df.iloc[pos]
+
+    def lookup_code(self, code):
+        """Busca un producto por código de barras o id_producto; devuelve la fila o None."""
+        with self._lock:
+            self.dataframe()
+            return self._lookup(self._published, code)
+
+    def cached_get(self, product_id):
+        """Como get, pero sin candado ni recarga: busca en el último inventario publicado.
+
+        No espera a una venta ni lee el disco, así que sirve en el hilo de la
+        interfaz; el dato puede estar desactualizado (las escrituras vuelven a
+        validar con el inventario vigente).
+        """
+        published = self._published
+        if published is None:
+            return None
+        df, ids, id_rows = published[:3]
+        pos = self._find(ids, id_rows, int(product_id))
+        if pos is None:
+            return None
+        return df.iloc[pos]
+
+    def cached_lookup_code(self, code):
+        """Como lookup_code, pero sin candado ni recarga (ver cached_get)."""
+        published = self._published
+        if published is None:
+            return None
+        return self._lookup(published, code)
+
+    def _write(self, write, df, catalog_changed):
+        try:
+            write()
+        except Exception:
+            self.invalidate()
+            raise
+        if catalog_changed:
+            self._search_index = None
+        self._set(df, self.storage.inventory_version(), catalog_changed)
+
+    def save(self, df, changed_ids=None, catalog_changed=True):
+        """Guarda el inventario y deja la copia en memoria sincronizada con el almacenamiento.
+
+        Si se indican changed_ids solo se escriben esos productos (cuando el
+        almacenamiento lo permite). Con catalog_changed=False se conserva el
+        índice de búsqueda.
+        """
+        with self._lock, self.storage.lock():
+            if changed_ids is None:
+                self._write(lambda: self.storage.save_inventory(df), df, catalog_changed)
+            else:
+                self._write(lambda: self.storage.update_products(df, changed_ids), df, catalog_changed)
+
+    @metrics.traced('sell_products')
+    def sell(self, cart, fecha):
+        """Descuenta del stock los productos del carrito {id: cantidad} y registra la venta.
+
+        Devuelve las líneas de venta, con el precio unitario en precio_venta.
+        Si algún producto no existe (KeyError) o no tiene stock suficiente
+        (ValueError) no se vende nada.
+        """
+        with self._lock, self.storage.lock():
+            inventory_df = self.dataframe()
+            positions = []
+            for item_id, cantidad in cart.items():
+                pos = self.position(item_id)
+                if pos is None:
+                    raise KeyError(f"Producto no encontrado: {item_id}")
+                item_row = inventory_df.iloc[pos]
+                if item_row['stock'] < cantidad:
+                    raise ValueError(f"Stock insuficiente de {item_row['nombre']}: quedan {item_row['stock']}")
+                positions.append(pos)
+            stock_col = inventory_df.columns.get_loc('stock')
+            sale_rows = []
+            for pos, (item_id, cantidad) in zip(positions, cart.items()):
+                item_row = inventory_df.iloc[pos]
+                precio_venta = int(item_row['precio_venta'])
+                inventory_df.iat[pos, stock_col] -= cantidad
+                # Las ventas se registran en pesos; el total se calcula en centavos
+                sale_rows.append({
+                    'fecha': fecha,
+                    'id_producto': item_id,
+                    'nombre': item_row['nombre'],
+                    'cantidad': cantidad,
+                    'total': precio_venta * cantidad / 100,
+                    'precio_venta': precio_venta / 100
+                })
+            self._write(lambda: self.storage.checkout(inventory_df, sale_rows), inventory_df, False)
+            for listener in self._sale_listeners:
+                listener(sale_rows)
+            return sale_rows
+
+    def _update_sale_prices(self, df, rows):
+        df.iloc[rows, df.columns.get_loc('precio_venta')] = self.pricing_rules().sale_prices(df.iloc[rows])
+
+    def add_product(self, values):
+        """Añade un producto a partir de un diccionario columna -> valor (precios en pesos)."""
+        with self._lock, self.storage.lock():
+            row = typed_inventory(pd.DataFrame([values]))
+            inventory_df = append_products(self.dataframe(), row)
+            self._update_sale_prices(inventory_df, [len(inventory_df) - 1])
+            self.save(inventory_df, changed_ids=[values['id_producto']])
+
+    def update_product(self, product_id, values):
+        """Modifica las columnas indicadas de un producto (precios en pesos)."""
+        with self._lock, self.storage.lock():
+            inventory_df = self.dataframe()
+            idx = self.position(product_id)
+            if idx is None:
+                raise KeyError(f"Producto no encontrado: {product_id}")
+            for column, value in values.items():
+                if column not in inventory_df.columns:
+                    inventory_df[column] = None
+                if column in PRICE_COLUMNS:
+                    value = int(to_cents(value))
+                elif pd.notna(value):
+                    add_categories(inventory_df, column, [value])
+                inventory_df.at[idx, column] = value
+            self._update_sale_prices(inventory_df, [idx])
+            self.save(inventory_df, changed_ids=[product_id])
+
+    def import_products(self, updates):
+        """Inserta o actualiza en bloque los productos de updates y guarda una sola vez.
+
+        updates trae id_producto y las columnas a cambiar (precios en pesos); los
+        valores nulos no modifican el producto y 'cantidad' se suma al stock. Los productos nuevos
+        necesitan nombre y precio. Devuelve {'nuevos', 'actualizados', 'rechazados'},
+        con las filas rechazadas en un DataFrame (fila, id_producto, error).
+        """
+        with self._lock, self.storage.lock():
+            # Se trabaja sobre una copia para que un error a mitad no deje cambios en memoria
+            inventory_df = self.dataframe().copy()
+            positions = pd.Index(inventory_df['id_producto']).get_indexer(updates['id_producto'])
+            existing = positions >= 0
+
+            # El stock resultante se calcula en int64: las filas en las que no cabe en
+            # el tipo de la columna se rechazan en vez de guardarse desbordadas
+            stock = np.zeros(len(updates), dtype=np.int64)
+            stock[existing] = inventory_df['stock'].to_numpy()[positions[existing]]
+            if 'stock' in updates.columns:
+                given = updates['stock'].notna().to_numpy()
+                stock[given] = updates['stock'].to_numpy()[given]
+            if 'cantidad' in updates.columns:
+                stock += updates['cantidad'].fillna(0).to_numpy(dtype=np.int64)
+            limits = np.iinfo(INVENTORY_DTYPES['stock'])
+            overflow = (stock < limits.min) | (stock > limits.max)
+            rejected = [pd.DataFrame({
+                'fila': updates['fila'][overflow], 'id_producto': updates['id_producto'][overflow],
+                'error': f'el stock resultante supera {limits.max}',
+            })]
+            updates, positions, existing = updates[~overflow], positions[~overflow], existing[~overflow]
+            stock = stock[~overflow]
+
+            new = updates[~existing]
+            complete = np.ones(len(new), dtype=bool)
+            for column in ('nombre', 'precio'):
+                complete &= new[column].notna().to_numpy() if column in new.columns else False
+            rejected.append(pd.DataFrame({
+                'fila': new['fila'][~complete], 'id_producto': new['id_producto'][~complete],
+                'error': 'producto nuevo sin nombre o precio',
+            }))
+            rejected = pd.concat(rejected, ignore_index=True)
+            new = new[complete]
+            new_stock = stock[~existing][complete]
+            if not existing.any() and new.empty:
+                return {'nuevos': 0, 'actualizados': 0, 'rechazados': rejected}
+
+            updated = updates[existing]
+            rows = positions[existing]
+            for column in INVENTORY_COLUMNS + OPTIONAL_INVENTORY_COLUMNS:
+                if column not in updated.columns or column in ('id_producto', 'stock'):
+                    continue
+                values = updated[column].to_numpy()
+                given = pd.notna(values)
+                if not given.any():
+                    continue
+                values = values[given]
+                if column not in inventory_df.columns:
+                    inventory_df[column] = None
+                if column in PRICE_COLUMNS:
+                    values = to_cents(values)
+                else:
+                    add_categories(inventory_df, column, values)
+                inventory_df.iloc[rows[given], inventory_df.columns.get_loc(column)] = values
+            if 'stock' in updated.columns or 'cantidad' in updated.columns:
+                inventory_df.iloc[rows, inventory_df.columns.get_loc('stock')] = (
+                    stock[existing].astype(inventory_df['stock'].dtype))
+
+            added = typed_inventory(new.drop(columns=['fila', 'cantidad'], errors='ignore').assign(stock=new_stock))
+            inventory_df = append_products(inventory_df, added)
+
+            # Solo se recalcula el precio de venta de las filas tocadas
+            touched = np.concatenate([rows, np.arange(len(inventory_df) - len(added), len(inventory_df))])
+            self._update_sale_prices(inventory_df, touched)
+            changed_ids = inventory_df['id_producto'].to_numpy()[touched].tolist()
+            self.save(inventory_df, changed_ids=changed_ids)
+            return {'nuevos': len(added), 'actualizados': int(existing.sum()), 'rechazados': rejected}
+
+    def reprice_preview(self, old_rules, new_rules):
+        """Productos cuyo precio de venta cambiaría al pasar de old_rules a new_rules, sin guardar nada."""
+        with self._lock:
+            return price_diff(self.dataframe(), old_rules, new_rules)
+
+    def reprice(self, old_rules, new_rules):
+        """Recalcula los precios afectados por un cambio de reglas y guarda solo esos precios."""
+        with self._lock, self.storage.lock():
+            inventory_df = self.dataframe()
+            changed_ids = reprice(inventory_df, old_rules, new_rules)
+            if changed_ids:
+                self._write(lambda: self.storage.update_prices(inventory_df, changed_ids), inventory_df, False)
+            return changed_ids
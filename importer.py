@@ -0,0 +1,104 @@
+import numpy as np
+import pandas as pd
+from storage import INVENTORY_DTYPES, MAX_PRODUCT_ID
+
+IMPORT_CHUNK_ROWS = 50_000
+# Columnas reconocidas en la hoja del proveedor; 'cantidad' se suma al stock actual
+IMPORT_COLUMNS = ['id_producto', 'nombre', 'precio', 'stock', 'cantidad',
+                  'porcentaje_incremento', 'categoria', 'codigo_barras']
+IMPORT_TEXT_COLUMNS = ['nombre', 'categoria', 'codigo_barras']
+IMPORT_INTEGER_COLUMNS = ['stock', 'cantidad']
+IMPORT_ERROR_COLUMNS = ['fila', 'id_producto', 'error']
+EXCEL_EXTENSIONS = ('.xlsx', '.xlsm')
+
+def read_supplier_chunks(path, chunksize=IMPORT_CHUNK_ROWS):
+    """Lee la hoja del proveedor (CSV o XLSX) por bloques, con todas las celdas como texto."""
+    if path.lower().endswith(EXCEL_EXTENSIONS):
+        try:
+            import openpyxl  # noqa: F401
+        except ImportError:
+            raise ValueError("Para importar archivos XLSX hay que instalar openpyxl (pip install openpyxl).")
+        # read_excel no lee por bloques: se trocea la hoja ya cargada
+        sheet = pd.read_excel(path, dtype=str)
+        for start in range(0, len(sheet), chunksize):
+            yield sheet.iloc[start:start + chunksize]
+    else:
+        yield from pd.read_csv(path, dtype=str, chunksize=chunksize, encoding='utf-8-sig')
+
+def _error_rows(lines, ids, mask, message):
+    return pd.DataFrame({'fila': lines[mask], 'id_producto': ids[mask], 'error': message})
+
+def validate_chunk(chunk, first_line):
+    """Valida un bloque de la hoja.
+
+    Devuelve (filas válidas, errores). Las celdas vacías significan "no cambiar";
+    fila es el número de línea en el archivo, contando el encabezado como 1.
+    """
+    chunk = chunk.reset_index(drop=True)
+    chunk.columns = [str(c).strip().lower() for c in chunk.columns]
+    if 'id_producto' not in chunk.columns:
+        raise ValueError("La hoja no tiene la columna id_producto.")
+    lines = np.arange(first_line, first_line + len(chunk))
+    raw_ids = chunk['id_producto'].fillna('').str.strip().to_numpy(dtype=object)
+    valid = pd.DataFrame({'fila': lines})
+    errors = []
+
+    ids = pd.to_numeric(chunk['id_producto'].str.strip(), errors='coerce').to_numpy(dtype=np.float64)
+    bad = np.isnan(ids) | (ids <= 0) | (ids % 1 != 0) | (ids > MAX_PRODUCT_ID)
+    errors.append(_error_rows(lines, raw_ids, bad, 'id_producto inválido'))
+    valid['id_producto'] = np.where(bad, 0, ids).astype(np.int64)
+    invalid = bad
+
+    for column in IMPORT_COLUMNS[1:]:
+        if column not in chunk.columns:
+            continue
+        raw = chunk[column].str.strip()
+        given = (raw.notna() & (raw != '')).to_numpy()
+        if column in IMPORT_TEXT_COLUMNS:
+            valid[column] = raw.where(given, None)
+            continue
+        values = pd.to_numeric(raw, errors='coerce').to_numpy(dtype=np.float64)
+        bad = given & (np.isnan(values) | (values < 0))
+        if column in IMPORT_INTEGER_COLUMNS:
+            bad |= given & ((values % 1 != 0) | (values > np.iinfo(INVENTORY_DTYPES['stock']).max))
+        errors.append(_error_rows(lines, raw_ids, bad, f'{column} inválido'))
+        valid[column] = np.where(given, values, np.nan)
+        invalid = invalid | bad
+
+    return valid[~invalid], pd.concat(errors, ignore_index=True)
+
+def parse_supplier_file(path, chunksize=IMPORT_CHUNK_ROWS):
+    """Lee y valida toda la hoja; devuelve (actualizaciones, errores).
+
+    Si un id_producto aparece varias veces se usa la última fila y las
+    anteriores se informan como error.
+    """
+    valid_chunks = []
+    error_chunks = []
+    first_line = 2
+    for chunk in read_supplier_chunks(path, chunksize):
+        valid, errors = validate_chunk(chunk, first_line)
+        valid_chunks.append(valid)
+        error_chunks.append(errors)
+        first_line += len(chunk)
+    if not valid_chunks:
+        return pd.DataFrame(columns=['fila'] + IMPORT_COLUMNS), pd.DataFrame(columns=IMPORT_ERROR_COLUMNS)
+    updates = pd.concat(valid_chunks, ignore_index=True)
+    repeated = updates['id_producto'].duplicated(keep='last').to_numpy()
+    error_chunks.append(_error_rows(updates['fila'].to_numpy(), updates['id_producto'].to_numpy(), repeated,
+                                    'id_producto repetido en el archivo; se usa la última fila'))
+    errors = pd.concat(error_chunks, ignore_index=True)
+    return updates[~repeated].reset_index(drop=True), errors
+
+def import_supplier_file(store, path, chunksize=IMPORT_CHUNK_ROWS):
+    """Importa una hoja de proveedor en el inventario con una sola escritura.
+
+    Devuelve un diccionario con la cantidad de productos nuevos y actualizados
+    y un DataFrame con los errores por fila (las filas con error no se aplican).
+    """
+    updates, errors = parse_supplier_file(path, chunksize)
+    result = store.import_products(updates)
+    rejected = result.pop('rechazados')
+    errors = pd.concat([errors, rejected], ignore_index=True)
+    result['errores'] = errors.sort_values('fila', kind='stable').reset_index(drop=True)[IMPORT_ERROR_COLUMNS]
+    return result
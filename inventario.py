@@ -1,15 +1,26 @@
 import os
 import sys
+import numpy as np
 import pandas as pd
 from datetime import datetime
-from math import ceil
 from PyQt5.QtWidgets import (
     QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, QLabel, QLineEdit,
-    QPushButton, QTableWidget, QTableWidgetItem, QTabWidget, QDialog, QFileDialog,
-    QSpinBox, QMessageBox, QInputDialog, QFormLayout, QDialogButtonBox, QHeaderView
+    QPushButton, QTableView, QTabWidget, QDialog, QFileDialog,
+    QSpinBox, QMessageBox, QInputDialog, QFormLayout, QDialogButtonBox, QHeaderView,
+    QDateEdit, QComboBox, QShortcut
 )
-from PyQt5.QtCore import Qt
-from PyQt5.QtGui import QFont
+from PyQt5.QtCore import (
+    Qt, QDate, QTimer, QAbstractTableModel, QModelIndex, QObject, QRunnable, QThreadPool, pyqtSignal
+)
+from PyQt5.QtGui import QFont, QKeySequence
+import metrics
+from storage import open_storage, PRICE_COLUMNS, SALES_COMPACT_BYTES
+from pricing import PricingRules
+from reports import sales_report
+from core import InventoryStore
+from importer import import_supplier_file
+from backup import BackupRepository
+from replenishment import ReorderPolicy, ReplenishmentEngine
 
 def resource_path(relative_path):
     """ Get absolute path to resource, works for dev and for PyInstaller """
@@ -23,62 +34,277 @@ def resource_path(relative_path):
 
 # Define paths
 current_dir = os.path.dirname(os.path.abspath(__file__))
-inventory_path = resource_path(os.path.join('data', 'inventario.csv'))
-sales_path = resource_path(os.path.join('data', 'sales.csv'))
-config_path = resource_path(os.path.join('data', 'config.csv'))
+data_dir = resource_path('data')
+
+# Milisegundos sin teclear antes de lanzar la búsqueda
+SEARCH_DEBOUNCE_MS = 150
+# Cada cuántos milisegundos se comprueba si la configuración cambió en disco
+CONFIG_POLL_MS = 2000
+# Hilos para lecturas y escrituras en disco
+IO_THREADS = 2
+# Atajo que muestra la pestaña oculta de diagnóstico y cada cuánto se refresca
+DIAGNOSTICS_SHORTCUT = 'Ctrl+Shift+D'
+DIAGNOSTICS_REFRESH_MS = 1000
+# Minutos entre copias de seguridad automáticas si la configuración no indica otro (0 las desactiva)
+BACKUP_INTERVAL_MINUTES = 60
+# Filas por página en la vista previa de un recálculo de precios
+REPRICE_PREVIEW_PAGE_ROWS = 500
 
 # Ensure the data directory exists
 os.makedirs(os.path.join(current_dir, 'data'), exist_ok=True)
 
-def round_up_to_nearest_ten(n):
-    """Redondea al alza a la decena más cercana."""
-    return ceil(n / 10.0) * 10
-
-def load_config():
-    """Carga la configuración desde un archivo CSV."""
-    if os.path.exists(config_path):
-        return pd.read_csv(config_path)
-    else:
-        # Configuración predeterminada
-        default_config = pd.DataFrame({'parametro': ['porcentaje_incremento'], 'valor': [30]})
-        save_config(default_config)
-        return default_config
-
-def save_config(df):
-    """Guarda la configuración en un archivo CSV."""
-    df.to_csv(config_path, index=False)
-
-def get_config_value(param):
-    """Obtiene el valor de un parámetro de configuración."""
-    config_df = load_config()
-    return config_df.loc[config_df['parametro'] == param, 'valor'].values[0]
-
-def load_inventory():
-    """Carga el inventario desde un archivo CSV, ajustando precios."""
+storage = open_storage(data_dir)
+
+def _typed_config_value(value):
+    """Convierte un valor de configuración a int o float cuando es numérico."""
     try:
-        df = pd.read_csv(inventory_path)
-        if 'porcentaje_incremento' not in df.columns:
-            df['porcentaje_incremento'] = get_config_value('porcentaje_incremento')
-        df['precio_venta'] = df['precio'] * (1 + df['porcentaje_incremento'] / 100)
-        df['precio_venta'] = df['precio_venta'].apply(round_up_to_nearest_ten)  # Redondear a la decena más cercana superior
+        number = float(value)
+    except (TypeError, ValueError):
+        return value
+    return int(number) if number.is_integer() else number
+
+class _IoTask(QRunnable):
+    def __init__(self, executor, fn, on_done, on_error, key):
+        super().__init__()
+        self.executor = executor
+        self.fn = fn
+        self.on_done = on_done
+        self.on_error = on_error
+        self.key = key
+
+    def run(self):
+        try:
+            result, ok = self.fn(), True
+        except Exception as e:
+            result, ok = e, False
+        self.executor._finished.emit(self, ok, result)
+
+class IoExecutor(QObject):
+    """Ejecuta lecturas y escrituras en disco fuera del hilo de la interfaz.
+
+    Los resultados vuelven al hilo principal mediante una señal, así que on_done
+    y on_error pueden tocar widgets. Las tareas con la misma key se agrupan:
+    si llega una mientras otra está en curso, solo se ejecuta la última y el
+    resultado de la anterior se descarta.
+    """
+
+    _finished = pyqtSignal(object, bool, object)
+    error = pyqtSignal(object)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._pool = QThreadPool(self)
+        self._pool.setMaxThreadCount(IO_THREADS)
+        self._running = set()
+        self._queued = {}
+        self._finished.connect(self._dispatch)
+
+    def submit(self, fn, on_done=None, on_error=None, key=None):
+        """Ejecuta fn en segundo plano y llama a on_done(resultado) u on_error(excepción)."""
+        if key is not None:
+            if key in self._running:
+                self._queued[key] = (fn, on_done, on_error)
+                return
+            self._running.add(key)
+        self._pool.start(_IoTask(self, fn, on_done, on_error, key))
+
+    def _dispatch(self, task, ok, result):
+        superseded = task.key is not None and task.key in self._queued
+        if task.key is not None:
+            self._running.discard(task.key)
+            if superseded:
+                self.submit(*self._queued.pop(task.key), key=task.key)
+        if not ok:
+            if task.on_error is not None:
+                task.on_error(result)
+            else:
+                self.error.emit(result)
+        elif task.on_done is not None and not superseded:
+            task.on_done(result)
+
+    def wait_for_done(self):
+        """Bloquea hasta que terminen las tareas en curso (p. ej. al cerrar la ventana)."""
+        self._pool.waitForDone()
+
+class ConfigService(QObject):
+    """Configuración en memoria con aviso de cambios.
+
+    Lee la configuración una vez, guarda los valores ya convertidos y solo la
+    vuelve a leer cuando cambia la versión del almacenamiento. Emite changed por
+    cada parámetro modificado y pricing_rules_changed(reglas_anteriores, nuevas)
+    cuando cambian las reglas de precio. Tras la carga inicial, las lecturas y
+    escrituras se hacen con el IoExecutor.
+    """
+
+    changed = pyqtSignal(str, object)
+    pricing_rules_changed = pyqtSignal(object, object)
+
+    def __init__(self, executor, parent=None):
+        super().__init__(parent)
+        self._executor = executor
+        self._df = None
+        self._values = {}
+        self._version = None
+        self._rules = None
+        self._reorder_policy = None
+        self._on_loaded(self._load_if_changed())
+        self._poll_timer = QTimer(self)
+        self._poll_timer.setInterval(CONFIG_POLL_MS)
+        self._poll_timer.timeout.connect(self.refresh)
+        self._poll_timer.start()
+
+    def refresh(self):
+        """Vuelve a leer la configuración si cambió en el almacenamiento."""
+        self._executor.submit(self._load_if_changed, self._on_loaded, key='config')
+
+    def _load_if_changed(self):
+        version = storage.config_version()
+        if self._df is not None and version == self._version:
+            return None
+        return version, storage.load_config()
+
+    def _on_loaded(self, result):
+        if result is None:
+            return
+        version, df = result
+        self._version = version
+        self._apply(df)
+
+    def _apply(self, df):
+        values = {param: _typed_config_value(value) for param, value in zip(df['parametro'], df['valor'])}
+        old_values, old_rules = self._values, self._rules
+        self._df = df
+        self._values = values
+        self._rules = PricingRules.from_config(df)
+        self._reorder_policy = ReorderPolicy.from_config(df)
+        if old_rules is None:
+            return
+        for param in values.keys() | old_values.keys():
+            if values.get(param) != old_values.get(param):
+                self.changed.emit(param, values.get(param))
+        if vars(old_rules) != vars(self._rules):
+            self.pricing_rules_changed.emit(old_rules, self._rules)
+
+    def get(self, param, default=None):
+        """Devuelve el valor de un parámetro de configuración."""
+        return self._values.get(param, default)
+
+    def pricing_rules(self):
+        """Reglas de precio vigentes según la configuración."""
+        return self._rules
+
+    def _with_value(self, param, value):
+        df = self._df.copy()
+        # read_csv deja 'valor' como int64 si todos los valores son enteros; como
+        # object admite cualquier valor nuevo (p. ej. un incremento de 35.5)
+        df['valor'] = df['valor'].astype(object)
+        if (df['parametro'] == param).any():
+            df.loc[df['parametro'] == param, 'valor'] = value
+        else:
+            df = pd.concat([df, pd.DataFrame({'parametro': [param], 'valor': [value]})], ignore_index=True)
         return df
-    except FileNotFoundError:
-        return pd.DataFrame(columns=['id_producto', 'nombre', 'precio', 'stock', 'porcentaje_incremento', 'precio_venta'])
 
-def save_inventory(df):
-    """Guarda el inventario en un archivo CSV."""
-    df.to_csv(inventory_path, index=False)
+    def reorder_policy(self):
+        """Parámetros de reposición vigentes según la configuración."""
+        return self._reorder_policy
+
+    def rules_with(self, param, value):
+        """Reglas de precio que resultarían de cambiar un parámetro, sin guardarlo."""
+        return PricingRules.from_config(self._with_value(param, value))
+
+    def set(self, param, value):
+        """Guarda un parámetro y avisa a quien dependa de él."""
+        df = self._with_value(param, value)
+        self._apply(df)
+        self._executor.submit(lambda: self._save(df), self._on_saved, key='config-save')
+
+    def _save(self, df):
+        storage.save_config(df)
+        return storage.config_version()
+
+    def _on_saved(self, version):
+        self._version = version
 
-def load_sales():
-    """Carga el registro de ventas desde un archivo CSV."""
-    if not os.path.exists(sales_path):
-        df = pd.DataFrame(columns=['fecha', 'id_producto', 'nombre', 'cantidad', 'total'])
-        df.to_csv(sales_path, index=False)
-    return pd.read_csv(sales_path)
+class DataFrameTableModel(QAbstractTableModel):
+    """Modelo de tabla que lee de un DataFrame solo las celdas visibles.
 
-def save_sales(df):
-    """Guarda el registro de ventas en un archivo CSV."""
-    df.to_csv(sales_path, index=False)
+    Guarda una referencia a las columnas del DataFrame y un arreglo con las
+    posiciones de fila a mostrar; filtrar u ordenar solo cambia ese arreglo.
+    Los campos de price_fields están en centavos y se muestran en pesos.
+    """
+
+    def __init__(self, columns, parent=None, price_fields=PRICE_COLUMNS):
+        super().__init__(parent)
+        self._price_fields = set(price_fields)
+        self._headers = [header for header, _ in columns]
+        self._fields = [field for _, field in columns]
+        self._columns = {field: np.empty(0, dtype=object) for field in self._fields}
+        self._filtered_rows = np.empty(0, dtype=np.int64)
+        self._rows = self._filtered_rows
+        self._sort_column = -1
+        self._sort_order = Qt.AscendingOrder
+
+    @metrics.traced('populate_table')
+    def set_rows(self, df, rows):
+        """Muestra las filas de df en las posiciones indicadas, conservando el orden activo."""
+        self.beginResetModel()
+        # Las columnas categóricas se guardan sin expandir (códigos + categorías)
+        self._columns = {field: df[field].array if isinstance(df[field].dtype, pd.CategoricalDtype)
+                         else df[field].to_numpy() for field in self._fields}
+        self._filtered_rows = np.asarray(rows, dtype=np.int64)
+        self._rows = self._sorted(self._filtered_rows)
+        self.endResetModel()
+
+    def _sorted(self, rows):
+        if self._sort_column < 0 or len(rows) == 0:
+            return rows
+        values = self._columns[self._fields[self._sort_column]][rows]
+        if isinstance(values, pd.Categorical):
+            # Se ordena por la posición alfabética de la categoría de cada fila
+            rank = np.empty(len(values.categories) + 1, dtype=np.int64)
+            rank[values.categories.argsort()] = np.arange(len(values.categories))
+            rank[-1] = -1
+            values = rank[values.codes]
+        try:
+            order = np.argsort(values, kind='stable')
+        except TypeError:
+            order = np.argsort(values.astype(str), kind='stable')
+        if self._sort_order == Qt.DescendingOrder:
+            order = order[::-1]
+        return rows[order]
+
+    def value(self, row, field):
+        """Devuelve el valor de un campo para una fila visible."""
+        return self._columns[field][self._rows[row]]
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._fields)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or role != Qt.DisplayRole:
+            return None
+        field = self._fields[index.column()]
+        value = self.value(index.row(), field)
+        if field in self._price_fields:
+            return f"{value / 100:.2f}"
+        return str(value)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role != Qt.DisplayRole:
+            return None
+        if orientation == Qt.Horizontal:
+            return self._headers[section]
+        return str(section + 1)
+
+    def sort(self, column, order=Qt.AscendingOrder):
+        self.layoutAboutToBeChanged.emit()
+        self._sort_column = column
+        self._sort_order = order
+        self._rows = self._sorted(self._filtered_rows)
+        self.layoutChanged.emit()
 
 class InventoryApp(QMainWindow):
     def __init__(self):
@@ -86,23 +312,39 @@ class InventoryApp(QMainWindow):
         self.setWindowTitle("Sistema de Gestión de Inventario")
         self.setGeometry(100, 100, 1000, 700)
         
+        self.io = IoExecutor(self)
+        self.io.error.connect(self.on_io_error)
+        self.config = ConfigService(self.io, self)
+        self.config.changed.connect(self.on_config_changed)
+        self.config.pricing_rules_changed.connect(self.on_pricing_rules_changed)
+        self.inventory_store = InventoryStore(storage, self.config.pricing_rules)
+        self.replenishment = ReplenishmentEngine(self.inventory_store, self.config.reorder_policy)
+        self.backups = BackupRepository(self.config.get('carpeta_copias') or os.path.join(data_dir, 'copias'))
+        self.backup_timer = QTimer(self)
+        self.backup_timer.timeout.connect(lambda: self.create_backup(notify=False))
+        self.schedule_backups(self.config.get('intervalo_copia_minutos', BACKUP_INTERVAL_MINUTES))
+        
         self.tabs = QTabWidget()
         self.setCentralWidget(self.tabs)
         
         self.sales_tab = QWidget()
         self.inventory_tab = QWidget()
         self.sales_record_tab = QWidget()
+        self.replenishment_tab = QWidget()
         self.settings_tab = QWidget()
         
         self.tabs.addTab(self.sales_tab, "Ventas")
         self.tabs.addTab(self.inventory_tab, "Inventario")
         self.tabs.addTab(self.sales_record_tab, "Registro de Ventas del Día")
+        self.tabs.addTab(self.replenishment_tab, "Reposición")
         self.tabs.addTab(self.settings_tab, "Configuración")
         
         self.create_sales_tab()
         self.create_inventory_tab()
         self.create_sales_record_tab()
+        self.create_replenishment_tab()
         self.create_settings_tab()
+        self.create_diagnostics_tab()
         
         self.apply_styles()
         
@@ -126,7 +368,7 @@ class InventoryApp(QMainWindow):
         background: white;
         border-bottom-color: white;
     }
-    QTableWidget {
+    QTableView {
         border: 1px solid #cccccc;
         background: #fafafa;
         alternate-background-color: #e8f4fc;
@@ -168,36 +410,62 @@ class InventoryApp(QMainWindow):
         self.sales_search_entry = QLineEdit()
         search_button = QPushButton("Buscar")
         search_button.clicked.connect(self.update_sales_tree)
+        self.sales_search_timer = self.create_search_timer(self.sales_search_entry, self.update_sales_tree)
         
         search_layout.addWidget(search_label)
         search_layout.addWidget(self.sales_search_entry)
         search_layout.addWidget(search_button)
         
-        self.sales_table = QTableWidget()
-        self.sales_table.setColumnCount(4)
-        self.sales_table.setHorizontalHeaderLabels(['ID Producto', 'Nombre', 'Precio Venta', 'Stock'])
-        self.sales_table.setSelectionBehavior(QTableWidget.SelectRows)
-        self.sales_table.setSelectionMode(QTableWidget.SingleSelection)
+        self.sales_model = DataFrameTableModel([
+            ('ID Producto', 'id_producto'), ('Nombre', 'nombre'),
+            ('Precio Venta', 'precio_venta'), ('Stock', 'stock')
+        ], self)
+        self.sales_table = QTableView()
+        self.sales_table.setModel(self.sales_model)
+        self.sales_table.setSelectionBehavior(QTableView.SelectRows)
+        self.sales_table.setSelectionMode(QTableView.SingleSelection)
+        self.sales_table.horizontalHeader().setSortIndicator(-1, Qt.AscendingOrder)
+        self.sales_table.setSortingEnabled(True)
+        self.sales_table.verticalHeader().setSectionResizeMode(QHeaderView.Fixed)
         self.sales_table.doubleClicked.connect(self.on_sales_item_select)
         
         self.sales_table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
         self.sales_table.setAlternatingRowColors(True)
         
+        scan_layout = QHBoxLayout()
+        self.scan_entry = QLineEdit()
+        self.scan_entry.setPlaceholderText("Escanee o escriba el código y presione Enter")
+        self.scan_entry.returnPressed.connect(self.on_scan)
+        scan_layout.addWidget(QLabel("Código de barras / ID:"))
+        scan_layout.addWidget(self.scan_entry)
+        
         self.selected_products = {}
+        self.selected_labels = {}
         self.selected_frame = QVBoxLayout()
         self.selected_frame.addWidget(QLabel("Productos Seleccionados"))
         
-        sell_button = QPushButton("Vender")
-        sell_button.clicked.connect(self.sell_products)
+        self.sell_button = QPushButton("Vender")
+        self.sell_button.clicked.connect(self.sell_products)
         
+        layout.addLayout(scan_layout)
         layout.addLayout(search_layout)
         layout.addWidget(self.sales_table)
         layout.addLayout(self.selected_frame)
-        layout.addWidget(sell_button)
+        layout.addWidget(self.sell_button)
         
         self.sales_tab.setLayout(layout)
+        self.scan_entry.setFocus()
         self.update_sales_tree()
         
+    def create_search_timer(self, entry, callback):
+        """Lanza la búsqueda al dejar de escribir durante SEARCH_DEBOUNCE_MS."""
+        timer = QTimer(self)
+        timer.setSingleShot(True)
+        timer.setInterval(SEARCH_DEBOUNCE_MS)
+        timer.timeout.connect(callback)
+        entry.textChanged.connect(timer.start)
+        return timer
+        
     def create_inventory_tab(self):
         layout = QVBoxLayout()
         
@@ -206,16 +474,23 @@ class InventoryApp(QMainWindow):
         self.inventory_search_entry = QLineEdit()
         search_button = QPushButton("Buscar")
         search_button.clicked.connect(self.update_inventory_tree)
+        self.inventory_search_timer = self.create_search_timer(self.inventory_search_entry, self.update_inventory_tree)
         
         search_layout.addWidget(search_label)
         search_layout.addWidget(self.inventory_search_entry)
         search_layout.addWidget(search_button)
         
-        self.inventory_table = QTableWidget()
-        self.inventory_table.setColumnCount(5)
-        self.inventory_table.setHorizontalHeaderLabels(['ID Producto', 'Nombre', 'Precio Mayorista', 'Stock', 'Precio Venta'])
-        self.inventory_table.setSelectionBehavior(QTableWidget.SelectRows)
-        self.inventory_table.setSelectionMode(QTableWidget.SingleSelection)
+        self.inventory_model = DataFrameTableModel([
+            ('ID Producto', 'id_producto'), ('Nombre', 'nombre'), ('Precio Mayorista', 'precio'),
+            ('Stock', 'stock'), ('Precio Venta', 'precio_venta')
+        ], self)
+        self.inventory_table = QTableView()
+        self.inventory_table.setModel(self.inventory_model)
+        self.inventory_table.setSelectionBehavior(QTableView.SelectRows)
+        self.inventory_table.setSelectionMode(QTableView.SingleSelection)
+        self.inventory_table.horizontalHeader().setSortIndicator(-1, Qt.AscendingOrder)
+        self.inventory_table.setSortingEnabled(True)
+        self.inventory_table.verticalHeader().setSectionResizeMode(QHeaderView.Fixed)
         
         self.inventory_table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
         self.inventory_table.setAlternatingRowColors(True)
@@ -227,10 +502,13 @@ class InventoryApp(QMainWindow):
         edit_button.clicked.connect(self.edit_product)
         update_button = QPushButton("Actualizar Inventario")
         update_button.clicked.connect(self.update_inventory_tree)
+        self.import_button = QPushButton("Importar Hoja de Proveedor")
+        self.import_button.clicked.connect(self.import_supplier_sheet)
         
         button_layout.addWidget(add_button)
         button_layout.addWidget(edit_button)
         button_layout.addWidget(update_button)
+        button_layout.addWidget(self.import_button)
         
         layout.addLayout(search_layout)
         layout.addWidget(self.inventory_table)
@@ -241,194 +519,482 @@ class InventoryApp(QMainWindow):
         
     def create_sales_record_tab(self):
         layout = QVBoxLayout()
-        show_button = QPushButton("Mostrar Ventas del Día")
+        
+        filter_layout = QHBoxLayout()
+        self.report_start_entry = QDateEdit(QDate.currentDate())
+        self.report_end_entry = QDateEdit(QDate.currentDate())
+        for entry in (self.report_start_entry, self.report_end_entry):
+            entry.setCalendarPopup(True)
+            entry.setDisplayFormat('yyyy-MM-dd')
+        self.report_view_combo = QComboBox()
+        self.report_view_combo.addItem("Por producto", 'por_producto')
+        self.report_view_combo.addItem("Por día", 'por_dia')
+        self.report_view_combo.addItem("Más vendidos", 'mas_vendidos')
+        self.report_view_combo.currentIndexChanged.connect(self.show_report_view)
+        show_button = QPushButton("Mostrar Ventas")
         show_button.clicked.connect(self.record_sales_day)
-        layout.addWidget(show_button)
+        
+        filter_layout.addWidget(QLabel("Desde:"))
+        filter_layout.addWidget(self.report_start_entry)
+        filter_layout.addWidget(QLabel("Hasta:"))
+        filter_layout.addWidget(self.report_end_entry)
+        filter_layout.addWidget(self.report_view_combo)
+        filter_layout.addWidget(show_button)
+        
+        product_columns = [
+            ('ID Producto', 'id_producto'), ('Nombre', 'nombre'), ('Cantidad', 'cantidad'), ('Total', 'total')
+        ]
+        self.report_models = {
+            'por_producto': DataFrameTableModel(product_columns, self),
+            'por_dia': DataFrameTableModel([('Fecha', 'fecha'), ('Cantidad', 'cantidad'), ('Total', 'total')], self),
+            'mas_vendidos': DataFrameTableModel(product_columns, self),
+        }
+        self.report_table = QTableView()
+        self.report_table.setSelectionBehavior(QTableView.SelectRows)
+        self.report_table.setSortingEnabled(True)
+        self.report_table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+        self.report_table.verticalHeader().setSectionResizeMode(QHeaderView.Fixed)
+        self.report_table.setAlternatingRowColors(True)
+        self.report_summary_label = QLabel()
+        
+        layout.addLayout(filter_layout)
+        layout.addWidget(self.report_table)
+        layout.addWidget(self.report_summary_label)
         self.sales_record_tab.setLayout(layout)
+        self.show_report_view()
+        
+    def create_replenishment_tab(self):
+        layout = QVBoxLayout()
+        
+        filter_layout = QHBoxLayout()
+        self.replenishment_view_combo = QComboBox()
+        self.replenishment_view_combo.addItem("Bajo punto de reorden", 'bajo')
+        self.replenishment_view_combo.addItem("Todos con ventas recientes", 'todos')
+        self.replenishment_view_combo.currentIndexChanged.connect(self.update_replenishment_view)
+        update_button = QPushButton("Actualizar")
+        update_button.clicked.connect(self.update_replenishment_view)
+        export_button = QPushButton("Exportar Pedido Sugerido")
+        export_button.clicked.connect(self.export_purchase_order)
+        filter_layout.addWidget(self.replenishment_view_combo)
+        filter_layout.addWidget(update_button)
+        filter_layout.addWidget(export_button)
+        
+        self.replenishment_model = DataFrameTableModel([
+            ('ID Producto', 'id_producto'), ('Nombre', 'nombre'), ('Stock', 'stock'),
+            ('Venta Diaria', 'venta_diaria'), ('Días Restantes', 'dias_restantes'),
+            ('Punto de Reorden', 'punto_reorden'), ('Pedido Sugerido', 'pedido_sugerido')
+        ], self)
+        replenishment_table = QTableView()
+        replenishment_table.setModel(self.replenishment_model)
+        replenishment_table.setSelectionBehavior(QTableView.SelectRows)
+        replenishment_table.setSortingEnabled(True)
+        replenishment_table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+        replenishment_table.verticalHeader().setSectionResizeMode(QHeaderView.Fixed)
+        replenishment_table.setAlternatingRowColors(True)
+        
+        layout.addLayout(filter_layout)
+        layout.addWidget(replenishment_table)
+        self.replenishment_tab.setLayout(layout)
+        self.update_replenishment_view()
         
     def create_settings_tab(self):
         layout = QVBoxLayout()
         
         form_layout = QFormLayout()
         self.increment_entry = QLineEdit()
-        self.increment_entry.setText(str(get_config_value('porcentaje_incremento')))
+        self.increment_entry.setText(str(self.config.get('porcentaje_incremento')))
         form_layout.addRow("Porcentaje de Incremento:", self.increment_entry)
         
         save_button = QPushButton("Guardar")
         save_button.clicked.connect(self.save_settings)
         
-        backup_inventory_button = QPushButton("Copia de Seguridad del Inventario")
-        backup_inventory_button.clicked.connect(lambda: self.backup_file(inventory_path))
-        backup_sales_button = QPushButton("Copia de Seguridad de Ventas")
-        backup_sales_button.clicked.connect(lambda: self.backup_file(sales_path))
+        create_backup_button = QPushButton("Crear Copia de Seguridad")
+        create_backup_button.clicked.connect(self.create_backup)
+        restore_backup_button = QPushButton("Restaurar Copia de Seguridad")
+        restore_backup_button.clicked.connect(self.restore_backup)
+        backup_inventory_button = QPushButton("Exportar Inventario a CSV")
+        backup_inventory_button.clicked.connect(lambda: self.backup_file(storage.export_inventory))
+        backup_sales_button = QPushButton("Exportar Ventas a CSV")
+        backup_sales_button.clicked.connect(lambda: self.backup_file(storage.export_sales))
         
         layout.addLayout(form_layout)
         layout.addWidget(save_button)
+        layout.addWidget(create_backup_button)
+        layout.addWidget(restore_backup_button)
         layout.addWidget(backup_inventory_button)
         layout.addWidget(backup_sales_button)
         
         self.settings_tab.setLayout(layout)
         
+    def create_diagnostics_tab(self):
+        """Pestaña oculta con las latencias medidas; se muestra con DIAGNOSTICS_SHORTCUT."""
+        self.diagnostics_tab = QWidget()
+        layout = QVBoxLayout()
+        
+        self.diagnostics_model = DataFrameTableModel([
+            ('Operación', 'operacion'), ('Llamadas', 'llamadas'), ('p50 (ms)', 'p50_ms'),
+            ('p95 (ms)', 'p95_ms'), ('p99 (ms)', 'p99_ms'), ('Máximo (ms)', 'max_ms')
+        ], self)
+        diagnostics_table = QTableView()
+        diagnostics_table.setModel(self.diagnostics_model)
+        diagnostics_table.setSortingEnabled(True)
+        diagnostics_table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+        self.diagnostics_counters_label = QLabel()
+        
+        button_layout = QHBoxLayout()
+        export_button = QPushButton("Exportar Traza")
+        export_button.clicked.connect(self.export_trace)
+        reset_button = QPushButton("Reiniciar Mediciones")
+        reset_button.clicked.connect(self.reset_diagnostics)
+        button_layout.addWidget(export_button)
+        button_layout.addWidget(reset_button)
+        
+        layout.addWidget(diagnostics_table)
+        layout.addWidget(self.diagnostics_counters_label)
+        layout.addLayout(button_layout)
+        self.diagnostics_tab.setLayout(layout)
+        
+        self.diagnostics_timer = QTimer(self)
+        self.diagnostics_timer.setInterval(DIAGNOSTICS_REFRESH_MS)
+        self.diagnostics_timer.timeout.connect(self.update_diagnostics)
+        QShortcut(QKeySequence(DIAGNOSTICS_SHORTCUT), self, self.toggle_diagnostics)
+        if metrics.is_enabled():
+            self.toggle_diagnostics()
+        
+    def toggle_diagnostics(self):
+        index = self.tabs.indexOf(self.diagnostics_tab)
+        if index >= 0:
+            self.tabs.removeTab(index)
+            self.diagnostics_timer.stop()
+            metrics.enable(False)
+            return
+        # Las mediciones solo se toman mientras la pestaña está visible
+        metrics.enable()
+        self.tabs.addTab(self.diagnostics_tab, "Diagnóstico")
+        self.update_diagnostics()
+        self.diagnostics_timer.start()
+        
+    def update_diagnostics(self):
+        df = metrics.summary().round(3)
+        self.diagnostics_model.set_rows(df, np.arange(len(df)))
+        counters = metrics.counters()
+        self.diagnostics_counters_label.setText(
+            f"Bytes leídos: {counters.get(metrics.BYTES_READ, 0):,}    "
+            f"Bytes escritos: {counters.get(metrics.BYTES_WRITTEN, 0):,}")
+        
+    def reset_diagnostics(self):
+        metrics.reset()
+        self.update_diagnostics()
+        
+    def export_trace(self):
+        options = QFileDialog.Options()
+        options |= QFileDialog.DontUseNativeDialog
+        path, _ = QFileDialog.getSaveFileName(self, "Exportar Traza", "", "Trazas (*.json);;All Files (*)", options=options)
+        if path:
+            self.io.submit(lambda: metrics.export_trace(path), on_error=self.on_io_error)
+        
     def update_inventory_tree(self):
+        self.inventory_search_timer.stop()
         query = self.inventory_search_entry.text()
-        inventory_df = load_inventory()
-        if query:
-            filtered_df = inventory_df[inventory_df['nombre'].str.contains(query, case=False, na=False)]
-        else:
-            filtered_df = inventory_df
-            
-        self.inventory_table.setRowCount(len(filtered_df))
-        for i, row in filtered_df.iterrows():
-            self.inventory_table.setItem(i, 0, QTableWidgetItem(str(row['id_producto'])))
-            self.inventory_table.setItem(i, 1, QTableWidgetItem(row['nombre']))
-            self.inventory_table.setItem(i, 2, QTableWidgetItem(str(row['precio'])))
-            self.inventory_table.setItem(i, 3, QTableWidgetItem(str(row['stock'])))
-            self.inventory_table.setItem(i, 4, QTableWidgetItem(str(row['precio_venta'])))
+        self.io.submit(lambda: self.inventory_store.search(query),
+                       on_done=lambda result: self.inventory_model.set_rows(*result),
+                       key='inventory-search')
             
     def update_sales_tree(self):
+        self.sales_search_timer.stop()
         query = self.sales_search_entry.text()
-        inventory_df = load_inventory()
-        if query:
-            filtered_df = inventory_df[inventory_df['nombre'].str.contains(query, case=False, na=False)]
-        else:
-            filtered_df = inventory_df
-            
-        self.sales_table.setRowCount(len(filtered_df))
-        for i, row in filtered_df.iterrows():
-            self.sales_table.setItem(i, 0, QTableWidgetItem(str(row['id_producto'])))
-            self.sales_table.setItem(i, 1, QTableWidgetItem(row['nombre']))
-            self.sales_table.setItem(i, 2, QTableWidgetItem(str(row['precio_venta'])))
-            self.sales_table.setItem(i, 3, QTableWidgetItem(str(row['stock'])))
+        self.io.submit(lambda: self.inventory_store.search(query),
+                       on_done=lambda result: self.sales_model.set_rows(*result),
+                       key='sales-search')
+        
+    def refresh_views(self):
+        self.update_inventory_tree()
+        self.update_sales_tree()
+        self.update_replenishment_view()
+        
+    def update_replenishment_view(self):
+        view = self.replenishment_view_combo.currentData()
+        fetch = self.replenishment.low_stock if view == 'bajo' else self.replenishment.suggestions
+        self.io.submit(fetch, on_done=lambda df: self.replenishment_model.set_rows(df, np.arange(len(df))),
+                       key='replenishment')
+        
+    def export_purchase_order(self):
+        options = QFileDialog.Options()
+        options |= QFileDialog.DontUseNativeDialog
+        path, _ = QFileDialog.getSaveFileName(self, "Exportar Pedido Sugerido", "", "CSV Files (*.csv);;All Files (*)", options=options)
+        if path:
+            self.io.submit(
+                lambda: self.replenishment.export_purchase_order(path),
+                on_done=lambda count: QMessageBox.information(self, "Pedido Sugerido", f"Se exportaron {count} productos a: {path}")
+            )
             
     def on_sales_item_select(self):
-        selected_row = self.sales_table.currentRow()
-        item_id = self.sales_table.item(selected_row, 0).text()
-        nombre = self.sales_table.item(selected_row, 1).text()
-        stock = int(self.sales_table.item(selected_row, 3).text())
-        cantidad, ok = QInputDialog.getInt(self, "Cantidad", f"Ingrese la cantidad a vender de {nombre}:", min=1, max=stock)
+        selected_row = self.sales_table.currentIndex().row()
+        item_id = str(self.sales_model.value(selected_row, 'id_producto'))
+        nombre = self.sales_model.value(selected_row, 'nombre')
+        available = int(self.sales_model.value(selected_row, 'stock')) - self.selected_products.get(item_id, 0)
+        if available < 1:
+            QMessageBox.critical(self, "Error", f"No queda stock disponible de {nombre}.")
+            return
+        cantidad, ok = QInputDialog.getInt(self, "Cantidad", f"Ingrese la cantidad a vender de {nombre}:", min=1, max=available)
         
         if ok:
             self.add_to_selected(item_id, cantidad, nombre)
             
+    def on_scan(self):
+        code = self.scan_entry.text().strip()
+        self.scan_entry.clear()
+        if not code:
+            return
+        # El inventario se recarga en el hilo de E/S; aquí solo se consulta el ya cargado
+        product = self.inventory_store.cached_lookup_code(code)
+        self.io.submit(self.inventory_store.dataframe, key='inventory-reload')
+        if product is None:
+            self.statusBar().showMessage(f"Código no encontrado: {code}", 5000)
+            return
+        item_id = str(product['id_producto'])
+        if self.selected_products.get(item_id, 0) + 1 > product['stock']:
+            self.statusBar().showMessage(f"Stock insuficiente de {product['nombre']}", 5000)
+            return
+        self.add_to_selected(item_id, 1, product['nombre'])
+        self.statusBar().showMessage(f"{product['nombre']}: {self.selected_products[item_id]} unidades", 3000)
+            
     def add_to_selected(self, item_id, cantidad, nombre):
-        if item_id not in self.selected_products:
+        if item_id in self.selected_products:
+            self.selected_products[item_id] += cantidad
+            self.selected_labels[item_id].setText(f"{nombre}: {self.selected_products[item_id]} unidades")
+        else:
             self.selected_products[item_id] = cantidad
             label = QLabel(f"{nombre}: {cantidad} unidades")
+            self.selected_labels[item_id] = label
             self.selected_frame.addWidget(label)
             
-    def sell_products(self):
-        total_venta = 0
-        inventory_df = load_inventory()
-        sales_df = load_sales()
-        factura_items = []
-        
-        for item_id, cantidad in self.selected_products.items():
-            item_row = inventory_df[inventory_df['id_producto'] == int(item_id)].iloc[0]
-            nombre = item_row['nombre']
-            precio_venta = item_row['precio_venta']
-            total_item = float(precio_venta) * cantidad
-            total_venta += total_item
+    def remove_from_selected(self, item_id, cantidad, nombre):
+        remaining = self.selected_products.get(item_id, 0) - cantidad
+        if remaining > 0:
+            self.selected_products[item_id] = remaining
+            self.selected_labels[item_id].setText(f"{nombre}: {remaining} unidades")
+        elif item_id in self.selected_products:
+            del self.selected_products[item_id]
+            self.selected_labels.pop(item_id).deleteLater()
             
-            factura_items.append(f"{nombre}: {cantidad} unidades x ${float(precio_venta):.2f} = ${total_item:.2f}")
-            
-            inventory_df.loc[inventory_df['id_producto'] == int(item_id), 'stock'] -= cantidad
-            
-            new_sale = pd.DataFrame([{
-                'fecha': datetime.now().strftime('%Y-%m-%d'),
-                'id_producto': item_id,
-                'nombre': nombre,
-                'cantidad': cantidad,
-                'total': total_item
-            }])
-            sales_df = pd.concat([sales_df, new_sale], ignore_index=True)
-            
-        save_inventory(inventory_df)
-        save_sales(sales_df)
+    def sell_products(self):
+        cart = dict(self.selected_products)
+        fecha = datetime.now().strftime('%Y-%m-%d')
+        self.sell_button.setEnabled(False)
+        self.io.submit(lambda: self.inventory_store.sell(cart, fecha),
+                       on_done=lambda sale_rows: self.on_sale_done(cart, sale_rows),
+                       on_error=self.on_sale_failed)
         
+    def on_sale_done(self, cart, sale_rows):
+        # El diario de ventas se compacta en segundo plano, fuera de la venta
+        self.io.submit(lambda: storage.compact_sales(SALES_COMPACT_BYTES), key='sales-compaction',
+                       on_error=lambda error: self.statusBar().showMessage(
+                           f"No se pudo compactar el diario de ventas: {error}", 5000))
+        total_venta = sum(row['total'] for row in sale_rows)
+        factura_items = [
+            f"{row['nombre']}: {row['cantidad']} unidades x ${row['precio_venta']:.2f} = ${row['total']:.2f}"
+            for row in sale_rows
+        ]
         factura_detalles = "\n".join(factura_items)
         QMessageBox.information(self, "Factura", f"Detalles de la venta:\n{factura_detalles}\n\nTotal a Pagar: ${total_venta:.2f}")
         
-        self.update_sales_tree()
-        for i in reversed(range(self.selected_frame.count())):
-            widget = self.selected_frame.itemAt(i).widget()
-            if widget:
-                widget.deleteLater()
-        self.selected_products.clear()
+        self.refresh_views()
+        # Mientras se guardaba la venta se pudieron agregar productos: solo se
+        # descuenta lo que se vendió y el resto queda en la selección
+        nombres = {str(row['id_producto']): row['nombre'] for row in sale_rows}
+        for item_id, cantidad in cart.items():
+            self.remove_from_selected(item_id, cantidad, nombres.get(item_id, item_id))
+        self.sell_button.setEnabled(True)
+        
+    def on_sale_failed(self, error):
+        self.sell_button.setEnabled(True)
+        # Otra terminal pudo haber vendido el stock: se muestra el que queda
+        self.refresh_views()
+        QMessageBox.critical(self, "Error", f"No se pudo registrar la venta: {error}")
         
     def add_product(self):
         dialog = ProductDialog(self, "Agregar Producto")
         dialog.exec_()
         if dialog.result() == QDialog.Accepted:
-            product_id, name, price, stock, increment = dialog.get_values()
-            inventory_df = load_inventory()
-            precio_venta = round_up_to_nearest_ten(price * (1 + increment / 100))
-            inventory_df.loc[len(inventory_df)] = [product_id, name, price, stock, increment, precio_venta]
-            save_inventory(inventory_df)
-            self.update_inventory_tree()
+            product_id, name, price, stock, increment, barcode = dialog.get_values()
+            values = {
+                'id_producto': product_id,
+                'nombre': name,
+                'precio': price,
+                'stock': stock,
+                'porcentaje_incremento': increment,
+                'codigo_barras': barcode
+            }
+            self.io.submit(lambda: self.inventory_store.add_product(values),
+                           on_done=lambda _: self.refresh_views())
         
     def edit_product(self):
-        selected_row = self.inventory_table.currentRow()
+        selected_row = self.inventory_table.currentIndex().row()
         if selected_row == -1:
             QMessageBox.critical(self, "Error", "No hay productos seleccionados para editar.")
             return
         
-        item_id = int(self.inventory_table.item(selected_row, 0).text())
-        inventory_df = load_inventory()
-        product_details = inventory_df[inventory_df['id_producto'] == item_id].iloc[0]
+        item_id = int(self.inventory_model.value(selected_row, 'id_producto'))
+        product_details = self.inventory_store.cached_get(item_id)
         
         dialog = ProductDialog(self, "Editar Producto", product_details)
         dialog.exec_()
         if dialog.result() == QDialog.Accepted:
-            product_id, name, price, stock, increment = dialog.get_values()
-            idx = inventory_df.index[inventory_df['id_producto'] == product_id].tolist()[0]
-            precio_venta = round_up_to_nearest_ten(price * (1 + increment / 100))
-            inventory_df.at[idx, 'nombre'] = name
-            inventory_df.at[idx, 'precio'] = price
-            inventory_df.at[idx, 'stock'] = stock
-            inventory_df.at[idx, 'porcentaje_incremento'] = increment
-            inventory_df.at[idx, 'precio_venta'] = precio_venta
-            save_inventory(inventory_df)
-            self.update_inventory_tree()
+            product_id, name, price, stock, increment, barcode = dialog.get_values()
+            values = {
+                'nombre': name,
+                'precio': price,
+                'stock': stock,
+                'porcentaje_incremento': increment,
+                'codigo_barras': barcode
+            }
+            self.io.submit(lambda: self.inventory_store.update_product(product_id, values),
+                           on_done=lambda _: self.refresh_views())
+        
+    def import_supplier_sheet(self):
+        options = QFileDialog.Options()
+        options |= QFileDialog.DontUseNativeDialog
+        path, _ = QFileDialog.getOpenFileName(self, "Importar Hoja de Proveedor", "", "Hojas de cálculo (*.csv *.xlsx);;All Files (*)", options=options)
+        if path:
+            self.import_button.setEnabled(False)
+            self.io.submit(lambda: import_supplier_file(self.inventory_store, path),
+                           on_done=self.on_import_done, on_error=self.on_import_failed)
+        
+    def on_import_done(self, result):
+        self.import_button.setEnabled(True)
+        self.refresh_views()
+        errors = result['errores']
+        summary = f"Productos nuevos: {result['nuevos']}\nProductos actualizados: {result['actualizados']}"
+        if errors.empty:
+            QMessageBox.information(self, "Importación", summary)
+            return
+        answer = QMessageBox.question(
+            self, "Importación",
+            f"{summary}\nFilas con errores (no importadas): {len(errors)}\n\n¿Desea guardar el informe de errores?")
+        if answer != QMessageBox.Yes:
+            return
+        options = QFileDialog.Options()
+        options |= QFileDialog.DontUseNativeDialog
+        report_path, _ = QFileDialog.getSaveFileName(self, "Guardar Informe de Errores", "", "CSV Files (*.csv);;All Files (*)", options=options)
+        if report_path:
+            self.io.submit(lambda: errors.to_csv(report_path, index=False), on_error=self.on_io_error)
+        
+    def on_import_failed(self, error):
+        self.import_button.setEnabled(True)
+        QMessageBox.critical(self, "Error", f"No se pudo importar la hoja: {error}")
         
     def record_sales_day(self):
-        sales_df = load_sales()
-        today = datetime.now().strftime('%Y-%m-%d')
-        today_sales = sales_df[sales_df['fecha'] == today]
+        start = self.report_start_entry.date().toString('yyyy-MM-dd')
+        end = self.report_end_entry.date().toString('yyyy-MM-dd')
+        if start > end:
+            QMessageBox.critical(self, "Error", "La fecha inicial es posterior a la fecha final.")
+            return
+        self.io.submit(lambda: sales_report(storage, start, end), on_done=self.show_sales_report, key='sales-report')
         
-        if today_sales.empty:
-            QMessageBox.information(self, "Registro de Ventas", "No se encontraron registros de ventas para hoy.")
-        else:
-            ventas_detalles = []
-            total_ventas = today_sales['total'].sum()
-            for _, row in today_sales.iterrows():
-                ventas_detalles.append(f"{row['nombre']}: {row['cantidad']} unidades x ${float(row['total']) / row['cantidad']:.2f} = ${float(row['total']):.2f}")
-                
-            ventas_detalles_str = "\n".join(ventas_detalles)
-            QMessageBox.information(self, "Registro de Ventas", f"Ventas del día:\n{ventas_detalles_str}\n\nTotal de ventas de hoy: ${total_ventas:.2f}")
+    def show_sales_report(self, report):
+        for name, model in self.report_models.items():
+            df = report[name].round({'total': 2})
+            model.set_rows(df, np.arange(len(df)))
+        self.report_summary_label.setText(
+            f"Unidades vendidas: {report['cantidad']}    Total de ventas: ${report['total']:.2f}")
+        
+    def show_report_view(self):
+        self.report_table.setModel(self.report_models[self.report_view_combo.currentData()])
             
     def save_settings(self):
         try:
             new_increment = float(self.increment_entry.text())
-            config_df = load_config()
-            config_df.loc[config_df['parametro'] == 'porcentaje_incremento', 'valor'] = new_increment
-            save_config(config_df)
-            QMessageBox.information(self, "Configuración", "Configuración guardada correctamente.")
         except ValueError:
             QMessageBox.critical(self, "Error", "Porcentaje de incremento inválido. Por favor, ingrese un número válido.")
+            return
+        old_rules = self.config.pricing_rules()
+        new_rules = self.config.rules_with('porcentaje_incremento', new_increment)
+        self.io.submit(lambda: self.inventory_store.reprice_preview(old_rules, new_rules),
+                       on_done=lambda diff: self.confirm_increment(new_increment, diff), key='reprice-preview')
         
-    def backup_file(self, file_path):
+    def confirm_increment(self, new_increment, diff):
+        """Muestra qué precios cambian y, si se acepta, guarda el incremento (que recalcula esos precios)."""
+        if not diff.empty:
+            dialog = RepricePreviewDialog(self, diff)
+            if dialog.exec_() != QDialog.Accepted:
+                self.increment_entry.setText(str(self.config.get('porcentaje_incremento')))
+                return
+        self.config.set('porcentaje_incremento', new_increment)
+        QMessageBox.information(self, "Configuración", f"Configuración guardada correctamente.\nPrecios actualizados: {len(diff)}")
+        
+    def on_config_changed(self, param, value):
+        if param == 'porcentaje_incremento':
+            self.increment_entry.setText(str(value))
+        elif param == 'intervalo_copia_minutos':
+            self.schedule_backups(value)
+            
+    def on_pricing_rules_changed(self, old_rules, new_rules):
+        self.io.submit(lambda: self.inventory_store.reprice(old_rules, new_rules),
+                       on_done=lambda changed_ids: self.refresh_views() if changed_ids else None)
+        
+    def on_io_error(self, error):
+        QMessageBox.critical(self, "Error", f"Error de lectura o escritura de datos: {error}")
+        
+    def closeEvent(self, event):
+        # No cerrar con una venta o un guardado a medio escribir
+        self.io.wait_for_done()
+        super().closeEvent(event)
+        
+    def schedule_backups(self, minutes):
+        try:
+            minutes = float(minutes)
+        except (TypeError, ValueError):
+            minutes = BACKUP_INTERVAL_MINUTES
+        if minutes > 0:
+            self.backup_timer.start(int(minutes * 60 * 1000))
+        else:
+            self.backup_timer.stop()
+        
+    def create_backup(self, notify=True):
+        def backup():
+            snapshot_id = self.backups.create(storage)
+            self.backups.prune()
+            return snapshot_id
+        on_done = (lambda snapshot_id: QMessageBox.information(self, "Copia de Seguridad", f"Copia de seguridad creada: {snapshot_id}")) if notify else None
+        self.io.submit(backup, on_done=on_done, key='backup')
+        
+    def restore_backup(self):
+        snapshots = self.backups.snapshots()[::-1]
+        if not snapshots:
+            QMessageBox.information(self, "Restaurar", "No hay copias de seguridad.")
+            return
+        snapshot_id, ok = QInputDialog.getItem(self, "Restaurar", "Copia a restaurar:", snapshots, 0, False)
+        if not ok:
+            return
+        answer = QMessageBox.question(
+            self, "Restaurar",
+            f"El inventario, las ventas y la configuración volverán al estado del {snapshot_id}.\n¿Desea continuar?")
+        if answer != QMessageBox.Yes:
+            return
+        self.io.submit(lambda: self.restore_snapshot(storage, snapshot_id),
+                       on_done=self.on_restore_done)
+        
+    def restore_snapshot(self, storage, snapshot_id):
+        # En el hilo de E/S: invalidate toma el candado del inventario
+        self.backups.restore(storage, snapshot_id)
+        self.inventory_store.invalidate()
+        
+    def on_restore_done(self, _):
+        self.config.refresh()
+        self.refresh_views()
+        QMessageBox.information(self, "Restaurar", "Copia de seguridad restaurada.")
+        
+    def backup_file(self, export):
         options = QFileDialog.Options()
         options |= QFileDialog.DontUseNativeDialog
         backup_path, _ = QFileDialog.getSaveFileName(self, "Guardar Copia de Seguridad", "", "CSV Files (*.csv);;All Files (*)", options=options)
         if backup_path:
-            try:
-                with open(file_path, 'r') as f:
-                    data = f.read()
-                with open(backup_path, 'w') as f:
-                    f.write(data)
-                QMessageBox.information(self, "Copia de Seguridad", f"Copia de seguridad realizada con éxito en: {backup_path}")
-            except Exception as e:
-                QMessageBox.critical(self, "Error", f"No se pudo realizar la copia de seguridad: {str(e)}")
+            self.io.submit(
+                lambda: export(backup_path),
+                on_done=lambda _: QMessageBox.information(self, "Copia de Seguridad", f"Copia de seguridad realizada con éxito en: {backup_path}"),
+                on_error=lambda e: QMessageBox.critical(self, "Error", f"No se pudo realizar la copia de seguridad: {str(e)}")
+            )
 
 class ProductDialog(QDialog):
     def __init__(self, parent=None, title="Agregar Producto", product_details=None):
@@ -444,20 +1010,26 @@ class ProductDialog(QDialog):
         self.price_entry = QLineEdit()
         self.stock_entry = QLineEdit()
         self.increment_entry = QLineEdit()
+        self.barcode_entry = QLineEdit()
         
         self.form_layout.addRow("ID Producto:", self.id_entry)
         self.form_layout.addRow("Nombre:", self.name_entry)
         self.form_layout.addRow("Precio (Mayorista):", self.price_entry)
         self.form_layout.addRow("Stock:", self.stock_entry)
         self.form_layout.addRow("Porcentaje de Incremento:", self.increment_entry)
+        self.increment_entry.setPlaceholderText("Vacío: usar el incremento general")
+        self.form_layout.addRow("Código de Barras:", self.barcode_entry)
         
         if product_details is not None:
             self.id_entry.setText(str(product_details['id_producto']))
             self.id_entry.setDisabled(True)
             self.name_entry.setText(product_details['nombre'])
-            self.price_entry.setText(str(product_details['precio']))
+            self.price_entry.setText(f"{product_details['precio'] / 100:.2f}")
             self.stock_entry.setText(str(product_details['stock']))
-            self.increment_entry.setText(str(product_details['porcentaje_incremento']))
+            if pd.notna(product_details['porcentaje_incremento']):
+                self.increment_entry.setText(str(product_details['porcentaje_incremento']))
+            if pd.notna(product_details.get('codigo_barras')):
+                self.barcode_entry.setText(str(product_details['codigo_barras']))
             
         self.button_box = QDialogButtonBox(QDialogButtonBox.Ok | QDialogButtonBox.Cancel)
         self.button_box.accepted.connect(self.accept)
@@ -470,7 +1042,69 @@ class ProductDialog(QDialog):
         self.setLayout(self.layout)
         
     def get_values(self):
-        return (int(self.id_entry.text()), self.name_entry.text(), float(self.price_entry.text()), int(self.stock_entry.text()), float(self.increment_entry.text()))
+        increment_text = self.increment_entry.text().strip()
+        increment = float(increment_text) if increment_text else np.nan
+        barcode = self.barcode_entry.text().strip() or None
+        return (int(self.id_entry.text()), self.name_entry.text(), float(self.price_entry.text()), int(self.stock_entry.text()), increment, barcode)
+
+class RepricePreviewDialog(QDialog):
+    """Vista previa paginada de los precios de venta que cambian antes de confirmar un recálculo."""
+
+    def __init__(self, parent, diff):
+        super().__init__(parent)
+        self.setWindowTitle("Confirmar Cambio de Precios")
+        self.setModal(True)
+        self.setGeometry(100, 100, 800, 600)
+        self.diff = diff
+        self.page = 0
+        self.pages = max(1, -(-len(diff) // REPRICE_PREVIEW_PAGE_ROWS))
+        
+        new_prices = diff['precio_venta_nuevo'].to_numpy()
+        old_prices = diff['precio_venta'].to_numpy()
+        summary = QLabel(
+            f"Cambia el precio de venta de {len(diff)} productos: "
+            f"{int((new_prices > old_prices).sum())} suben y {int((new_prices < old_prices).sum())} bajan.")
+        
+        self.model = DataFrameTableModel([
+            ('ID Producto', 'id_producto'), ('Nombre', 'nombre'), ('Precio Mayorista', 'precio'),
+            ('Precio Venta Actual', 'precio_venta'), ('Precio Venta Nuevo', 'precio_venta_nuevo')
+        ], self, price_fields=['precio', 'precio_venta', 'precio_venta_nuevo'])
+        table = QTableView()
+        table.setModel(self.model)
+        table.setSortingEnabled(True)
+        table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+        table.setAlternatingRowColors(True)
+        
+        page_layout = QHBoxLayout()
+        self.previous_button = QPushButton("Anterior")
+        self.previous_button.clicked.connect(lambda: self.show_page(self.page - 1))
+        self.next_button = QPushButton("Siguiente")
+        self.next_button.clicked.connect(lambda: self.show_page(self.page + 1))
+        self.page_label = QLabel()
+        page_layout.addWidget(self.previous_button)
+        page_layout.addWidget(self.page_label)
+        page_layout.addWidget(self.next_button)
+        
+        button_box = QDialogButtonBox(QDialogButtonBox.Ok | QDialogButtonBox.Cancel)
+        button_box.button(QDialogButtonBox.Ok).setText("Aplicar")
+        button_box.accepted.connect(self.accept)
+        button_box.rejected.connect(self.reject)
+        
+        layout = QVBoxLayout()
+        layout.addWidget(summary)
+        layout.addWidget(table)
+        layout.addLayout(page_layout)
+        layout.addWidget(button_box)
+        self.setLayout(layout)
+        self.show_page(0)
+        
+    def show_page(self, page):
+        self.page = min(max(page, 0), self.pages - 1)
+        start = self.page * REPRICE_PREVIEW_PAGE_ROWS
+        self.model.set_rows(self.diff, np.arange(start, min(start + REPRICE_PREVIEW_PAGE_ROWS, len(self.diff))))
+        self.page_label.setText(f"Página {self.page + 1} de {self.pages}")
+        self.previous_button.setEnabled(self.page > 0)
+        self.next_button.setEnabled(self.page < self.pages - 1)
 
 if __name__ == '__main__':
     app = QApplication(sys.argv)
@@ -0,0 +1,114 @@
+import functools
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+import numpy as np
+import pandas as pd
+
+# Duraciones que se guardan por operación; las más antiguas se descartan
+MAX_SAMPLES = 10_000
+BYTES_READ = 'disco_bytes_leidos'
+BYTES_WRITTEN = 'disco_bytes_escritos'
+SUMMARY_COLUMNS = ['operacion', 'llamadas', 'p50_ms', 'p95_ms', 'p99_ms', 'max_ms']
+
+_enabled = os.environ.get('INVENTARIO_DIAGNOSTICO') == '1'
+_lock = threading.Lock()
+_spans = {}
+_counters = {}
+_origin = time.perf_counter()
+
+def enable(on=True):
+    """Activa o desactiva la medición. Desactivada solo cuesta comprobar una variable."""
+    global _enabled
+    _enabled = on
+
+def is_enabled():
+    return _enabled
+
+def reset():
+    """Descarta las mediciones y contadores acumulados."""
+    with _lock:
+        _spans.clear()
+        _counters.clear()
+
+def _record(name, start, duration):
+    with _lock:
+        samples = _spans.get(name)
+        if samples is None:
+            samples = _spans[name] = deque(maxlen=MAX_SAMPLES)
+        samples.append((start - _origin, duration, threading.get_ident()))
+
+@contextmanager
+def span(name):
+    """Mide la duración del bloque y la registra con el nombre indicado."""
+    if not _enabled:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _record(name, start, time.perf_counter() - start)
+
+def traced(name):
+    """Decorador que mide cada llamada a la función como span(name)."""
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return fn(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                _record(name, start, time.perf_counter() - start)
+        return wrapper
+    return decorate
+
+def count(name, amount=1):
+    """Suma amount a un contador."""
+    if not _enabled:
+        return
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + amount
+
+def count_file(name, path):
+    """Suma al contador el tamaño de un archivo (p. ej. uno recién leído o escrito)."""
+    if not _enabled:
+        return
+    try:
+        count(name, os.path.getsize(path))
+    except OSError:
+        pass
+
+def counters():
+    """Copia de los contadores."""
+    with _lock:
+        return dict(_counters)
+
+def summary():
+    """Percentiles de duración por operación, en milisegundos."""
+    with _lock:
+        durations = {name: np.array([s[1] for s in samples]) for name, samples in _spans.items()}
+    rows = []
+    for name, values in sorted(durations.items()):
+        p50, p95, p99 = np.percentile(values, [50, 95, 99]) * 1000
+        rows.append((name, len(values), p50, p95, p99, values.max() * 1000))
+    return pd.DataFrame(rows, columns=SUMMARY_COLUMNS)
+
+def export_trace(path):
+    """Guarda las mediciones en formato Trace Event (se abre con chrome://tracing o Perfetto)."""
+    with _lock:
+        events = [
+            {'name': name, 'ph': 'X', 'pid': os.getpid(), 'tid': tid,
+             'ts': round(start * 1e6), 'dur': round(duration * 1e6)}
+            for name, samples in _spans.items() for start, duration, tid in samples
+        ]
+        now = round((time.perf_counter() - _origin) * 1e6)
+        events.extend({'name': name, 'ph': 'C', 'pid': os.getpid(), 'ts': now, 'args': {name: value}}
+                      for name, value in _counters.items())
+    with open(path, 'w') as f:
+        json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
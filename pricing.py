@@ -0,0 +1,114 @@
+import numpy as np
+import pandas as pd
+
+DEFAULT_MARKUP = 30
+DEFAULT_STEP = 10
+# Prefijo de los parámetros de configuración con el incremento de una categoría,
+# p. ej. "porcentaje_incremento:PAPELERIA"
+CATEGORY_MARKUP_PREFIX = 'porcentaje_incremento:'
+# Columnas de la vista previa de un recálculo de precios (precios en centavos)
+PRICE_DIFF_COLUMNS = ['id_producto', 'nombre', 'precio', 'precio_venta', 'precio_venta_nuevo']
+
+def apply_markup(cents, markups, step=DEFAULT_STEP):
+    """Aplica el incremento (en %) a precios en centavos y redondea al alza a múltiplos de step pesos.
+
+    Se calcula con enteros (incremento en centésimas de punto) para que
+    130.00000000000003 no suba a 140 ni se acumulen errores de redondeo.
+    """
+    basis_points = np.round(np.asarray(markups, dtype=np.float64) * 100).astype(np.int64)
+    raw = np.asarray(cents, dtype=np.int64) * (10_000 + basis_points)
+    step_cents = max(int(round(step * 100)), 1)
+    return -(-raw // (10_000 * step_cents)) * step_cents
+
+class PricingRules:
+    """Reglas para calcular el precio de venta.
+
+    El incremento de un producto se toma, por orden de prioridad, de su propia
+    columna porcentaje_incremento, de la regla de su categoría o del incremento
+    general. El resultado se redondea al alza a múltiplos de step pesos. Los
+    precios se reciben y se devuelven en centavos enteros.
+    """
+
+    def __init__(self, default_markup=DEFAULT_MARKUP, step=DEFAULT_STEP, category_markups=None):
+        self.default_markup = float(default_markup)
+        self.step = float(step)
+        self.category_markups = dict(category_markups or {})
+
+    @classmethod
+    def from_config(cls, config_df):
+        """Construye las reglas a partir del DataFrame de configuración (parametro, valor)."""
+        values = dict(zip(config_df['parametro'], config_df['valor']))
+        categories = {
+            param[len(CATEGORY_MARKUP_PREFIX):]: float(value)
+            for param, value in values.items()
+            if str(param).startswith(CATEGORY_MARKUP_PREFIX)
+        }
+        return cls(
+            default_markup=values.get('porcentaje_incremento', DEFAULT_MARKUP),
+            step=values.get('paso_redondeo', DEFAULT_STEP),
+            category_markups=categories,
+        )
+
+    def rule_markups(self, df):
+        """Incremento que correspondería a cada producto sin contar su valor propio."""
+        markups = np.full(len(df), self.default_markup)
+        if self.category_markups and 'categoria' in df.columns:
+            by_category = df['categoria'].map(self.category_markups).to_numpy(dtype=np.float64, na_value=np.nan)
+            markups = np.where(np.isnan(by_category), markups, by_category)
+        return markups
+
+    def effective_markups(self, df):
+        """Incremento aplicado a cada producto."""
+        markups = self.rule_markups(df)
+        if 'porcentaje_incremento' in df.columns:
+            own = pd.to_numeric(df['porcentaje_incremento'], errors='coerce').to_numpy(dtype=np.float64, na_value=np.nan)
+            markups = np.where(np.isnan(own), markups, own)
+        return markups
+
+    def sale_prices(self, df):
+        """Precio de venta en centavos de cada producto del DataFrame."""
+        return apply_markup(df['precio'].to_numpy(dtype=np.int64), self.effective_markups(df), self.step)
+
+def apply_prices(df, rules):
+    """Calcula la columna precio_venta de todo el DataFrame."""
+    df['precio_venta'] = rules.sale_prices(df)
+    return df
+
+def affected_rows(df, old_rules, new_rules):
+    """Máscara de los productos cuyo precio puede cambiar al pasar de old_rules a new_rules."""
+    if old_rules.step != new_rules.step:
+        return np.ones(len(df), dtype=bool)
+    if 'porcentaje_incremento' in df.columns:
+        follows_rules = pd.to_numeric(df['porcentaje_incremento'], errors='coerce').isna().to_numpy()
+    else:
+        follows_rules = np.ones(len(df), dtype=bool)
+    return follows_rules & (old_rules.rule_markups(df) != new_rules.rule_markups(df))
+
+def price_changes(df, old_rules, new_rules):
+    """Posiciones de fila y nuevos precios de venta (centavos) de los productos cuyo precio cambia.
+
+    Solo se recalculan los productos afectados por el cambio de reglas.
+    """
+    positions = np.flatnonzero(affected_rows(df, old_rules, new_rules))
+    if not len(positions):
+        return positions, np.empty(0, dtype=np.int64)
+    subset = df.iloc[positions]
+    new_prices = new_rules.sale_prices(subset)
+    changed = new_prices != subset['precio_venta'].to_numpy(dtype=np.int64)
+    return positions[changed], new_prices[changed]
+
+def price_diff(df, old_rules, new_rules):
+    """DataFrame con los productos cuyo precio de venta cambiaría y su precio nuevo, sin modificar df."""
+    positions, new_prices = price_changes(df, old_rules, new_rules)
+    diff = df.iloc[positions][PRICE_DIFF_COLUMNS[:-1]].reset_index(drop=True)
+    diff['precio_venta_nuevo'] = new_prices
+    return diff
+
+def reprice(df, old_rules, new_rules):
+    """Recalcula precio_venta solo en los productos afectados por el cambio de reglas.
+
+    Modifica df y devuelve los id_producto cuyo precio de venta cambió.
+    """
+    positions, new_prices = price_changes(df, old_rules, new_rules)
+    df.iloc[positions, df.columns.get_loc('precio_venta')] = new_prices
+    return df['id_producto'].to_numpy()[positions].tolist()
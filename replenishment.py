@@ -0,0 +1,159 @@
+import math
+import threading
+from datetime import date, timedelta
+import numpy as np
+import pandas as pd
+
+DEFAULT_LEAD_DAYS = 7
+DEFAULT_SAFETY_DAYS = 3
+DEFAULT_COVER_DAYS = 14
+DEFAULT_VELOCITY_DAYS = 14
+# Al reconstruir la velocidad se leen los acumulados de VELOCITY_DAYS * SEED_WINDOWS
+# días; las ventas más antiguas pesan menos de un 2 %
+SEED_WINDOWS = 4
+REORDER_COLUMNS = ['id_producto', 'nombre', 'stock', 'venta_diaria', 'dias_restantes',
+                   'punto_reorden', 'pedido_sugerido']
+
+class ReorderPolicy:
+    """Parámetros de reposición.
+
+    La velocidad de venta es una media exponencial de las unidades diarias con
+    constante velocity_days. El punto de reorden cubre lead_days de entrega más
+    safety_days de seguridad, y el pedido sugerido repone hasta cubrir además
+    cover_days de venta.
+    """
+
+    def __init__(self, lead_days=DEFAULT_LEAD_DAYS, safety_days=DEFAULT_SAFETY_DAYS,
+                 cover_days=DEFAULT_COVER_DAYS, velocity_days=DEFAULT_VELOCITY_DAYS):
+        self.lead_days = float(lead_days)
+        self.safety_days = float(safety_days)
+        self.cover_days = float(cover_days)
+        self.velocity_days = max(float(velocity_days), 1.0)
+
+    @classmethod
+    def from_config(cls, config_df):
+        """Construye la política a partir del DataFrame de configuración (parametro, valor)."""
+        values = dict(zip(config_df['parametro'], config_df['valor']))
+        return cls(
+            lead_days=values.get('dias_entrega', DEFAULT_LEAD_DAYS),
+            safety_days=values.get('dias_seguridad', DEFAULT_SAFETY_DAYS),
+            cover_days=values.get('dias_cobertura', DEFAULT_COVER_DAYS),
+            velocity_days=values.get('dias_velocidad', DEFAULT_VELOCITY_DAYS),
+        )
+
+def _day(fecha):
+    return date.fromisoformat(str(fecha)[:10]).toordinal()
+
+class ReplenishmentEngine:
+    """Velocidad de venta por producto, actualizada con cada venta.
+
+    Por producto se guarda la suma de unidades vendidas con decaimiento
+    exponencial y el día al que corresponde. Una venta solo actualiza los
+    productos del carrito (O(productos vendidos)); las vistas se calculan al
+    pedirlas, de forma vectorizada, sobre los productos que tienen ventas.
+
+    La primera vez, y cada vez que el inventario se recarga del disco (p. ej.
+    porque vendió otra terminal), el estado se reconstruye con los acumulados
+    diarios de las últimas semanas. policy es una función sin argumentos que
+    devuelve la ReorderPolicy vigente.
+    """
+
+    def __init__(self, store, policy):
+        self.store = store
+        self.policy = policy
+        self._lock = threading.Lock()
+        self._sold = None
+        self._velocity_days = None
+        store.add_sale_listener(self.record_sales)
+        store.add_reload_listener(self.invalidate)
+
+    def invalidate(self):
+        """Descarta el estado; se reconstruye con los acumulados en la próxima consulta."""
+        with self._lock:
+            self._sold = None
+
+    def _decay(self, days):
+        return math.exp(-days / self._velocity_days)
+
+    def _seed(self, today, velocity_days):
+        start = date.fromordinal(today) - timedelta(days=int(velocity_days * SEED_WINDOWS))
+        daily = self.store.storage.daily_rollup(start.isoformat(), date.fromordinal(today).isoformat())
+        if daily.empty:
+            return {}
+        days = np.array([_day(f) for f in daily['fecha']])
+        weighted = daily['cantidad'].to_numpy(dtype=np.float64) * np.exp(-(today - days) / velocity_days)
+        totals = pd.Series(weighted).groupby(daily['id_producto'].to_numpy()).sum()
+        return {int(pid): (total, today) for pid, total in totals.items()}
+
+    def record_sales(self, sale_rows):
+        """Suma las líneas de una venta ya guardada a la velocidad de sus productos."""
+        with self._lock:
+            if self._sold is None:
+                return
+            for row in sale_rows:
+                pid = int(row['id_producto'])
+                day = _day(row['fecha'])
+                total, last = self._sold.get(pid, (0.0, day))
+                if day >= last:
+                    self._sold[pid] = (total * self._decay(day - last) + row['cantidad'], day)
+                else:
+                    self._sold[pid] = (total + row['cantidad'] * self._decay(last - day), last)
+
+    def velocities(self, today=None):
+        """DataFrame (id_producto, venta_diaria) de los productos con ventas recientes."""
+        today = (today or date.today()).toordinal()
+        velocity_days = self.policy().velocity_days
+        while True:
+            with self._lock:
+                if self._sold is not None and self._velocity_days == velocity_days:
+                    ids = np.fromiter(self._sold.keys(), dtype=np.int64, count=len(self._sold))
+                    state = np.array(list(self._sold.values()), dtype=np.float64).reshape(-1, 2)
+                    break
+            # Con sales_lock ninguna venta queda a medias entre los acumulados leídos
+            # y record_sales (se contaría dos veces); el propio candado se toma solo
+            # al publicar el estado, no durante la lectura
+            with self.store.sales_lock():
+                sold = self._seed(today, velocity_days)
+                with self._lock:
+                    self._sold = sold
+                    self._velocity_days = velocity_days
+        # Con ventas constantes de r unidades diarias la suma decae hasta r / (1 - e^(-1/τ))
+        decayed = state[:, 0] * np.exp(-np.maximum(today - state[:, 1], 0) / velocity_days)
+        return pd.DataFrame({'id_producto': ids, 'venta_diaria': decayed * (1 - math.exp(-1 / velocity_days))})
+
+    def suggestions(self, today=None):
+        """Punto de reorden y pedido sugerido de cada producto con ventas recientes.
+
+        Ordenado por días de stock restantes (los más urgentes primero).
+        """
+        policy = self.policy()
+        velocity = self.velocities(today)
+        df = self.store.dataframe()
+        positions = pd.Index(df['id_producto'].astype(np.int64)).get_indexer(velocity['id_producto'])
+        velocity = velocity[positions >= 0]
+        positions = positions[positions >= 0]
+        rate = velocity['venta_diaria'].to_numpy()
+        stock = df['stock'].to_numpy()[positions].astype(np.int64)
+        reorder_point = np.ceil(rate * (policy.lead_days + policy.safety_days)).astype(np.int64)
+        target = np.ceil(rate * (policy.lead_days + policy.safety_days + policy.cover_days)).astype(np.int64)
+        result = pd.DataFrame({
+            'id_producto': velocity['id_producto'].to_numpy(),
+            'nombre': df['nombre'].to_numpy()[positions],
+            'stock': stock,
+            'venta_diaria': rate.round(2),
+            'dias_restantes': np.where(rate > 0, np.maximum(stock, 0) / np.where(rate > 0, rate, 1), np.inf).round(1),
+            'punto_reorden': reorder_point,
+            'pedido_sugerido': np.maximum(target - stock, 0),
+        })[REORDER_COLUMNS]
+        return result.sort_values('dias_restantes', kind='stable', ignore_index=True)
+
+    def low_stock(self, today=None):
+        """Productos cuyo stock está en o por debajo de su punto de reorden."""
+        df = self.suggestions(today)
+        return df[(df['stock'] <= df['punto_reorden']) & (df['pedido_sugerido'] > 0)].reset_index(drop=True)
+
+    def export_purchase_order(self, path, today=None):
+        """Guarda en CSV la lista de pedido sugerida (productos bajo el punto de reorden)."""
+        df = self.low_stock(today)
+        df.to_csv(path, index=False)
+        return len(df)
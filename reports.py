@@ -0,0 +1,28 @@
+import metrics
+from storage import to_cents
+
+# Cantidad de productos que se muestran como más vendidos
+TOP_SELLERS = 10
+
+@metrics.traced('record_sales_day')
+def sales_report(storage, start, end, top=TOP_SELLERS):
+    """Resume las ventas entre dos fechas 'AAAA-MM-DD' a partir de los acumulados diarios.
+
+    Devuelve un diccionario con los DataFrames por_dia, por_producto y
+    mas_vendidos, y los totales cantidad y total del periodo.
+    """
+    daily = storage.daily_rollup(start, end)
+    por_dia = (daily.groupby('fecha', as_index=False)[['cantidad', 'total']].sum()
+               .sort_values('fecha', ignore_index=True))
+    por_producto = (daily.groupby('id_producto', as_index=False)
+                    .agg(nombre=('nombre', 'last'), cantidad=('cantidad', 'sum'), total=('total', 'sum'))
+                    .sort_values('total', ascending=False, ignore_index=True))
+    mas_vendidos = por_producto.sort_values('cantidad', ascending=False, kind='stable', ignore_index=True).head(top)
+    return {
+        'por_dia': por_dia,
+        'por_producto': por_producto,
+        'mas_vendidos': mas_vendidos,
+        'cantidad': int(daily['cantidad'].sum()) if len(daily) else 0,
+        # Se suma en centavos para no acumular errores de redondeo
+        'total': int(to_cents(daily['total']).sum()) / 100 if len(daily) else 0.0,
+    }
@@ -0,0 +1,1046 @@
+import csv
+import io
+import json
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+import numpy as np
+import pandas as pd
+import metrics
+from metrics import BYTES_READ, BYTES_WRITTEN
+
+INVENTORY_COLUMNS = ['id_producto', 'nombre', 'precio', 'stock', 'precio_venta', 'porcentaje_incremento']
+# Columnas que el inventario puede traer o no (p. ej. para reglas de precio por categoría)
+OPTIONAL_INVENTORY_COLUMNS = ['categoria', 'codigo_barras']
+SALES_COLUMNS = ['fecha', 'id_producto', 'nombre', 'cantidad', 'total']
+# Los acumulados diarios tienen una fila por (fecha, id_producto)
+ROLLUP_COLUMNS = SALES_COLUMNS
+DEFAULT_CONFIG = {'parametro': ['porcentaje_incremento'], 'valor': [30]}
+# Tipos del inventario en memoria
+INVENTORY_DTYPES = {'id_producto': np.int64, 'stock': np.int32, 'categoria': 'category',
+                    'porcentaje_incremento': np.float64}
+# Mayor id_producto admitido: el mayor entero que float64 representa exacto, ya que
+# las hojas de proveedor se leen como números de punto flotante (alcanza para EAN-13)
+MAX_PRODUCT_ID = 2 ** 53 - 1
+# Los nombres se guardan como categorías solo si en una muestra se repiten lo
+# suficiente; con nombres casi todos distintos las categorías ocupan más
+NAME_SAMPLE_ROWS = 10_000
+MAX_DISTINCT_NAME_RATIO = 0.5
+# En memoria los precios son enteros en centavos; en disco se guardan en pesos
+PRICE_COLUMNS = ['precio', 'precio_venta']
+
+# Bytes del diario de ventas sin compactar a partir de los cuales se pasan a un segmento
+SALES_COMPACT_BYTES = 1024 * 1024
+# Un segmento de ventas que dejó de usarse se borra pasado este tiempo, por si otra
+# terminal lo está leyendo todavía
+SALES_SEGMENT_GRACE_SECONDS = 600
+# Bytes del diario previos a una marca de avance que se guardan para validarla
+JOURNAL_GUARD_BYTES = 64
+# Versión del formato de la instantánea binaria del inventario
+SNAPSHOT_FORMAT = 2
+# Separador de los textos en la instantánea; no puede aparecer en los valores
+SNAPSHOT_TEXT_SEPARATOR = '\x00'
+# Segundos que se espera el candado de los datos antes de desistir
+LOCK_TIMEOUT = 30
+LOCK_POLL_INTERVAL = 0.01
+# Permisos de los archivos de datos que se crean al escribir de forma atómica
+NEW_FILE_MODE = 0o644
+
+if os.name == 'nt':
+    import msvcrt
+
+    def _try_lock_file(f):
+        f.seek(0)
+        try:
+            msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+            return True
+        except OSError:
+            return False
+
+    def _unlock_file(f):
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+else:
+    import fcntl
+
+    def _try_lock_file(f):
+        try:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return True
+        except BlockingIOError:
+            return False
+
+    def _unlock_file(f):
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+class FileLock:
+    """Candado exclusivo entre procesos sobre un archivo, reentrante en el mismo hilo.
+
+    Lo usan las terminales que comparten la carpeta de datos para que sus
+    escrituras no se pisen. Dentro del proceso los hilos se turnan con un RLock.
+    """
+
+    def __init__(self, path, timeout=LOCK_TIMEOUT):
+        self.path = path
+        self.timeout = timeout
+        self._thread_lock = threading.RLock()
+        self._depth = 0
+        self._file = None
+
+    def _acquire_file(self):
+        f = open(self.path, 'a+b')
+        deadline = time.monotonic() + self.timeout
+        while not _try_lock_file(f):
+            if time.monotonic() > deadline:
+                f.close()
+                raise TimeoutError(f"Otra terminal tiene ocupados los datos ({self.path}); intente de nuevo.")
+            time.sleep(LOCK_POLL_INTERVAL)
+        self._file = f
+
+    def __enter__(self):
+        self._thread_lock.acquire()
+        if self._depth == 0:
+            try:
+                self._acquire_file()
+            except BaseException:
+                self._thread_lock.release()
+                raise
+        self._depth += 1
+        return self
+
+    def __exit__(self, *exc_info):
+        self._depth -= 1
+        if self._depth == 0:
+            _unlock_file(self._file)
+            self._file.close()
+            self._file = None
+        self._thread_lock.release()
+
+def aggregate_daily(sales_df):
+    """Agrupa líneas de venta por día y producto."""
+    return (sales_df.groupby(['fecha', 'id_producto'], as_index=False, sort=False)
+            .agg(nombre=('nombre', 'last'), cantidad=('cantidad', 'sum'), total=('total', 'sum'))
+            [ROLLUP_COLUMNS])
+
+def to_cents(values):
+    """Convierte importes en pesos a centavos enteros (los nulos quedan en 0)."""
+    values = np.nan_to_num(np.asarray(values, dtype=np.float64))
+    return np.round(values * 100).astype(np.int64)
+
+def from_cents(values):
+    """Convierte centavos enteros a pesos."""
+    return np.asarray(values, dtype=np.int64) / 100
+
+def _check_integers(values, column, low, high):
+    """Lanza ValueError si algún valor no es un entero entre low y high (nunca se trunca)."""
+    numbers = pd.to_numeric(values, errors='coerce').to_numpy(dtype=np.float64, na_value=np.nan)
+    bad = np.isnan(numbers) | (numbers % 1 != 0) | (numbers < low) | (numbers > high)
+    if bad.any():
+        raise ValueError(f"{column} inválido o fuera de rango en {int(bad.sum())} filas "
+                         f"(p. ej. {values.iloc[int(np.argmax(bad))]})")
+
+def compact_inventory(df):
+    """Aplica los tipos compactos de INVENTORY_DTYPES a las columnas presentes.
+
+    Los enteros se comprueban antes de convertirlos: un id o un stock que no
+    cabe en su tipo lanza ValueError en lugar de guardarse truncado.
+    """
+    for column, dtype in INVENTORY_DTYPES.items():
+        if column not in df.columns or df[column].dtype == dtype:
+            continue
+        if column == 'stock':
+            df[column] = pd.to_numeric(df[column], errors='coerce').fillna(0)
+        elif column == 'porcentaje_incremento':
+            df[column] = pd.to_numeric(df[column], errors='coerce')
+        if column == 'id_producto':
+            _check_integers(df[column], column, 0, MAX_PRODUCT_ID)
+        elif column == 'stock':
+            info = np.iinfo(dtype)
+            _check_integers(df[column], column, info.min, info.max)
+        df[column] = df[column].astype(dtype)
+    return df
+
+def encode_repeated_names(names):
+    """Codifica los nombres como categorías si se repiten mucho; si no, los deja igual."""
+    sample = names.iloc[:NAME_SAMPLE_ROWS]
+    if isinstance(names.dtype, pd.CategoricalDtype) or sample.nunique() > MAX_DISTINCT_NAME_RATIO * len(sample):
+        return names
+    codes, uniques = pd.factorize(names)
+    return pd.Series(pd.Categorical.from_codes(codes, uniques), index=names.index, name=names.name)
+
+def typed_inventory(df):
+    """Pasa un inventario leído de disco (precios en pesos) a la representación en memoria."""
+    df = compact_inventory(df)
+    if 'nombre' in df.columns:
+        df['nombre'] = encode_repeated_names(df['nombre'])
+    for column in PRICE_COLUMNS:
+        if column in df.columns:
+            df[column] = to_cents(pd.to_numeric(df[column], errors='coerce'))
+    return df
+
+def inventory_for_disk(df):
+    """Copia del inventario con los precios en pesos, como se guarda en disco."""
+    return df.assign(**{column: from_cents(df[column]) for column in PRICE_COLUMNS if column in df.columns})
+
+def _file_signature(path):
+    st = os.stat(path)
+    return [st.st_mtime_ns, st.st_size]
+
+def _write_text(path, values):
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        f.write(SNAPSHOT_TEXT_SEPARATOR.join(values))
+    metrics.count_file(BYTES_WRITTEN, path)
+
+def _read_text(path, count):
+    with open(path, 'r', encoding='utf-8', newline='') as f:
+        text = f.read()
+    metrics.count_file(BYTES_READ, path)
+    values = text.split(SNAPSHOT_TEXT_SEPARATOR) if count else []
+    if len(values) != count:
+        raise ValueError(f"Instantánea dañada: {path}")
+    return values
+
+def write_snapshot(df, directory, source):
+    """Guarda df como instantánea columnar (un .npy por columna) de la versión source de su origen.
+
+    source es cualquier valor JSON que identifique lo instantáneado (p. ej. la
+    firma del CSV); read_snapshot solo la acepta si coincide. Devuelve False si
+    df tiene valores que la instantánea no puede representar.
+
+    Los números se guardan tal cual, las categorías como códigos más el texto de
+    las categorías y el resto como texto UTF-8 con una máscara de nulos. El
+    archivo meta.json se borra al empezar y se escribe al final, así que una
+    instantánea a medio escribir nunca se considera válida.
+    """
+    os.makedirs(directory, exist_ok=True)
+    meta_path = os.path.join(directory, 'meta.json')
+    if os.path.exists(meta_path):
+        os.remove(meta_path)
+    columns = []
+    for i, column in enumerate(df.columns):
+        series = df[column]
+        base = os.path.join(directory, str(i))
+        entry = {'name': column}
+        if series.dtype.kind in 'iufb':
+            entry['kind'] = 'numeric'
+            np.save(base + '.npy', series.to_numpy())
+            metrics.count_file(BYTES_WRITTEN, base + '.npy')
+            columns.append(entry)
+            continue
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            entry['kind'] = 'category'
+            array = series.cat.codes.to_numpy()
+            texts = [str(c) for c in series.cat.categories]
+        else:
+            entry['kind'] = 'text'
+            entry['dtype'] = str(series.dtype)
+            array = series.isna().to_numpy()
+            texts = series.astype(object).where(~array, '').astype(str).tolist()
+        entry['texts'] = len(texts)
+        if any(SNAPSHOT_TEXT_SEPARATOR in text for text in texts):
+            # Valores que la instantánea no puede representar: se seguirá usando el CSV
+            return False
+        np.save(base + '.npy', array)
+        metrics.count_file(BYTES_WRITTEN, base + '.npy')
+        _write_text(base + '.txt', texts)
+        columns.append(entry)
+    meta = {'format': SNAPSHOT_FORMAT, 'rows': len(df), 'columns': columns, 'source': source}
+    with _replacing(meta_path) as tmp_path:
+        with open(tmp_path, 'w') as f:
+            json.dump(meta, f)
+    return True
+
+def read_snapshot(directory, source):
+    """Lee la instantánea columnar si se escribió para la versión source de su origen; si no, None.
+
+    Los .npy se abren con memoria mapeada y se copian de una vez, sin interpretar texto.
+    """
+    try:
+        with open(os.path.join(directory, 'meta.json'), 'r') as f:
+            meta = json.load(f)
+        if meta.get('format') != SNAPSHOT_FORMAT or meta['source'] != source:
+            return None
+        data = {}
+        for i, column in enumerate(meta['columns']):
+            base = os.path.join(directory, str(i))
+            array = np.array(np.load(base + '.npy', mmap_mode='r'))
+            metrics.count_file(BYTES_READ, base + '.npy')
+            if len(array) != meta['rows']:
+                return None
+            if column['kind'] == 'numeric':
+                data[column['name']] = array
+            elif column['kind'] == 'category':
+                data[column['name']] = pd.Categorical.from_codes(array, _read_text(base + '.txt', column['texts']))
+            else:
+                texts = pd.Series(_read_text(base + '.txt', column['texts']), dtype=object)
+                data[column['name']] = texts.mask(array).astype(column['dtype'])
+        return pd.DataFrame(data, columns=[column['name'] for column in meta['columns']])
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+
+@contextmanager
+def _replacing(path):
+    """Da un archivo temporal único junto a path que, si el bloque termina bien, lo reemplaza.
+
+    El nombre es único para que dos escrituras simultáneas del mismo archivo
+    (de hilos o procesos distintos) no se pisen el temporal; si el bloque falla
+    el temporal se borra y path queda como estaba.
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or '.', prefix=os.path.basename(path) + '.', suffix='.tmp')
+    os.close(fd)
+    try:
+        # mkstemp crea el archivo solo legible por su dueño; se conservan los permisos
+        # del archivo que se reemplaza para no cerrárselo a otras terminales
+        try:
+            os.chmod(tmp_path, os.stat(path).st_mode & 0o777)
+        except FileNotFoundError:
+            os.chmod(tmp_path, NEW_FILE_MODE)
+        yield tmp_path
+        metrics.count_file(BYTES_WRITTEN, tmp_path)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def _write_stream_atomic(parts, path):
+    """Escribe los bloques de bytes de parts en un archivo temporal y lo reemplaza de una vez."""
+    with _replacing(path) as tmp_path:
+        with open(tmp_path, 'wb') as f:
+            for data in parts:
+                f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+
+def _write_csv_atomic(df, path):
+    """Escribe un CSV en un archivo temporal y lo reemplaza de una vez."""
+    with _replacing(path) as tmp_path:
+        df.to_csv(tmp_path, index=False)
+
+def _pin_file(path):
+    """Crea junto a path un enlace duro (o una copia) con nombre único y devuelve su ruta."""
+    fd, pinned = tempfile.mkstemp(dir=os.path.dirname(path) or '.', prefix=os.path.basename(path) + '.', suffix='.copia')
+    os.close(fd)
+    os.remove(pinned)
+    try:
+        os.link(path, pinned)
+    except OSError:
+        shutil.copyfile(path, pinned)
+    return pinned
+
+class CsvStorage:
+    """Almacenamiento en los CSV de la carpeta de datos.
+
+    El inventario y la configuración se reescriben completos (de forma atómica);
+    las ventas se tratan como un diario al que solo se añaden líneas.
+    """
+
+    def __init__(self, data_dir):
+        self.data_dir = data_dir
+        self.inventory_path = os.path.join(data_dir, 'inventario.csv')
+        self.sales_path = os.path.join(data_dir, 'sales.csv')
+        self.config_path = os.path.join(data_dir, 'config.csv')
+        self.sales_segments_dir = os.path.join(data_dir, 'ventas.segmentos')
+        self.sales_segments_meta_path = os.path.join(self.sales_segments_dir, 'estado.json')
+        self.rollups_dir = os.path.join(data_dir, 'ventas_diarias')
+        self.rollups_meta_path = os.path.join(self.rollups_dir, 'estado.json')
+        self.inventory_snapshot_dir = os.path.join(data_dir, 'inventario.snapshot')
+        self._lock = FileLock(os.path.join(data_dir, 'inventario.lock'))
+
+    def lock(self):
+        """Candado compartido por todas las terminales que usan esta carpeta de datos."""
+        return self._lock
+
+    def load_config(self):
+        """Carga la configuración desde un archivo CSV."""
+        if os.path.exists(self.config_path):
+            metrics.count_file(BYTES_READ, self.config_path)
+            return pd.read_csv(self.config_path)
+        else:
+            # Configuración predeterminada
+            default_config = pd.DataFrame(DEFAULT_CONFIG)
+            self.save_config(default_config)
+            return default_config
+
+    def save_config(self, df):
+        """Guarda la configuración en un archivo CSV."""
+        _write_csv_atomic(df, self.config_path)
+
+    def config_version(self):
+        """Marca que cambia cada vez que se modifica la configuración en disco."""
+        try:
+            return os.stat(self.config_path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def inventory_version(self):
+        """Marca que cambia cada vez que se modifica el inventario en disco.
+
+        Cada escritura reemplaza el archivo, así que el inodo cambia aunque dos
+        escrituras caigan en la misma marca de tiempo.
+        """
+        try:
+            st = os.stat(self.inventory_path)
+        except FileNotFoundError:
+            return None
+        return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+    def load_inventory(self):
+        """Carga el inventario con los tipos compactos, sin calcular precios.
+
+        Si la instantánea binaria corresponde al CSV actual se usa esa; si no,
+        se interpreta el CSV y se regenera la instantánea.
+        """
+        try:
+            # La firma se toma antes de leer: si otra terminal reemplaza el CSV mientras
+            # se interpreta, la instantánea no debe quedar con las filas viejas y la firma nueva
+            signature = _file_signature(self.inventory_path)
+            df = read_snapshot(self.inventory_snapshot_dir, signature)
+            if df is not None:
+                return df
+            # Los códigos de barras se leen como texto para no perder ceros ni convertirlos a float
+            df = pd.read_csv(self.inventory_path,
+                             dtype={'codigo_barras': str, 'categoria': 'category'})
+        except FileNotFoundError:
+            return typed_inventory(pd.DataFrame(columns=INVENTORY_COLUMNS))
+        metrics.count_file(BYTES_READ, self.inventory_path)
+        df = typed_inventory(df)
+        self._write_inventory_snapshot(df, signature)
+        return df
+
+    def _write_inventory_snapshot(self, df, signature):
+        """Guarda la instantánea de df, leído del CSV cuya firma era signature.
+
+        Se escribe con el candado tomado (dos terminales no mezclan sus .npy) y
+        solo si el CSV sigue siendo esa versión.
+        """
+        try:
+            with self._lock:
+                if _file_signature(self.inventory_path) == signature:
+                    write_snapshot(df, self.inventory_snapshot_dir, signature)
+        except OSError:
+            # La instantánea es solo una caché: si no se puede escribir (o el candado
+            # está ocupado) se sigue con el CSV
+            pass
+
+    @metrics.traced('save_inventory')
+    def save_inventory(self, df):
+        """Guarda el inventario completo (CSV y su instantánea binaria)."""
+        with self._lock:
+            _write_csv_atomic(inventory_for_disk(df), self.inventory_path)
+            self._write_inventory_snapshot(df, _file_signature(self.inventory_path))
+
+    def update_products(self, df, changed_ids):
+        """Guarda cambios en algunos productos; en CSV implica reescribir el archivo."""
+        self.save_inventory(df)
+
+    def update_prices(self, df, changed_ids):
+        """Guarda precio_venta de algunos productos; en CSV implica reescribir el archivo."""
+        self.save_inventory(df)
+
+    def checkout(self, inventory_df, sale_rows):
+        """Registra una venta: guarda el stock ya descontado y añade las líneas al diario.
+
+        Quien llama debe tener tomado lock() y haber descontado el stock sobre
+        el inventario vigente en disco. Los acumulados diarios no se tocan: los
+        pone al día daily_rollup al consultarlos, así la venta no reescribe la
+        partición del mes con el candado de todas las terminales tomado.
+
+        Tampoco se compacta el diario: eso lo pide la aplicación en segundo plano
+        con compact_sales.
+        """
+        with self._lock:
+            self.save_inventory(inventory_df)
+            self.append_sales(sale_rows)
+
+    def _journal_meta(self, meta_path):
+        """Lee la marca de meta_path; devuelve (marca, byte del diario hasta el que está procesado).
+
+        Devuelve (None, 0) si no hay marca o si los bytes previos ya no coinciden
+        (el diario se reemplazó o se truncó).
+        """
+        try:
+            with open(meta_path, 'r') as f:
+                meta = json.load(f)
+            offset = meta['offset']
+            guard = bytes.fromhex(meta['guard'])
+            if offset == 0 or os.path.getsize(self.sales_path) < offset:
+                return None, 0
+            with open(self.sales_path, 'rb') as f:
+                f.seek(offset - len(guard))
+                if f.read(len(guard)) != guard:
+                    return None, 0
+            return meta, offset
+        except (OSError, ValueError, KeyError):
+            return None, 0
+
+    def _journal_offset(self, meta_path):
+        """Lee hasta qué byte del diario de ventas está procesado según meta_path (0 si no vale)."""
+        return self._journal_meta(meta_path)[1]
+
+    def _write_journal_offset(self, meta_path, offset, **extra):
+        """Guarda una marca de hasta qué byte del diario está procesado (con los datos de extra)."""
+        with open(self.sales_path, 'rb') as f:
+            f.seek(max(0, offset - JOURNAL_GUARD_BYTES))
+            guard = f.read(offset - f.tell())
+        with _replacing(meta_path) as tmp_path:
+            with open(tmp_path, 'w') as f:
+                json.dump({'offset': offset, 'guard': guard.hex(), **extra}, f)
+
+    def _read_journal_from(self, offset):
+        """Lee las líneas del diario desde offset; devuelve (df, byte final leído)."""
+        if not os.path.exists(self.sales_path):
+            df = pd.DataFrame(columns=SALES_COLUMNS)
+            df.to_csv(self.sales_path, index=False)
+        with open(self.sales_path, 'rb') as f:
+            f.seek(offset)
+            data = f.read()
+        metrics.count(BYTES_READ, len(data))
+        end = offset + len(data)
+        if offset == 0:
+            return pd.read_csv(io.BytesIO(data)), end
+        if not data.strip():
+            return pd.DataFrame(columns=SALES_COLUMNS), end
+        return pd.read_csv(io.BytesIO(data), header=None, names=SALES_COLUMNS), end
+
+    def _sales_segments(self):
+        """Devuelve ([[nombre, byte final], ...], byte final) de los segmentos vigentes."""
+        meta, offset = self._journal_meta(self.sales_segments_meta_path)
+        if offset == 0:
+            return [], 0
+        return meta.get('segments', []), offset
+
+    @staticmethod
+    def _segment_ranges(segments):
+        """(nombre, byte inicial, byte final) de cada segmento; van seguidos desde el byte 0."""
+        starts = [0] + [end for _, end in segments[:-1]]
+        return [(name, start, end) for (name, end), start in zip(segments, starts)]
+
+    def _read_segment(self, name, start, end):
+        return read_snapshot(os.path.join(self.sales_segments_dir, name), [start, end])
+
+    def _read_sales_segments(self):
+        """Devuelve (df, desplazamiento) con las ventas de los segmentos si siguen siendo válidos."""
+        segments, offset = self._sales_segments()
+        if offset == 0:
+            return None, 0
+        parts = []
+        for name, start, end in self._segment_ranges(segments):
+            df = self._read_segment(name, start, end)
+            if df is None:
+                return None, 0
+            parts.append(df)
+        if not parts or segments[-1][1] != offset:
+            return None, 0
+        return pd.concat(parts, ignore_index=True), offset
+
+    def _load_sales_with_offset(self):
+        """Carga las ventas y devuelve también hasta qué byte del diario se leyó."""
+        segments_df, offset = self._read_sales_segments()
+        if segments_df is None:
+            return self._read_journal_from(0)
+        tail_df, end = self._read_journal_from(offset)
+        if tail_df.empty:
+            return segments_df, end
+        return pd.concat([segments_df, tail_df], ignore_index=True), end
+
+    @metrics.traced('load_sales')
+    def load_sales(self):
+        """Carga el registro de ventas: segmentos compactados más la cola del diario."""
+        return self._load_sales_with_offset()[0]
+
+    def save_sales(self, df):
+        """Reescribe el registro de ventas completo."""
+        _write_csv_atomic(df, self.sales_path)
+
+    def append_sales(self, rows):
+        """Añade líneas de venta al diario con una sola escritura y fsync."""
+        if not rows:
+            return
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, lineterminator='\n')
+        if not os.path.exists(self.sales_path) or os.path.getsize(self.sales_path) == 0:
+            writer.writerow(SALES_COLUMNS)
+        for row in rows:
+            writer.writerow([row[col] for col in SALES_COLUMNS])
+        data = buffer.getvalue().encode('utf-8')
+        with open(self.sales_path, 'ab') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        metrics.count(BYTES_WRITTEN, len(data))
+
+    def sales_journal_pending_bytes(self):
+        """Bytes del diario de ventas que aún no están en los segmentos compactados."""
+        if not os.path.exists(self.sales_path):
+            return 0
+        return os.path.getsize(self.sales_path) - self._journal_offset(self.sales_segments_meta_path)
+
+    def _write_segment(self, df, start, end):
+        """Guarda df (las ventas de los bytes start a end del diario) como segmento; devuelve su nombre o None."""
+        name = f'{start:012d}-{end:012d}-{uuid.uuid4().hex[:8]}'
+        path = os.path.join(self.sales_segments_dir, name)
+        if write_snapshot(df, path, [start, end]):
+            return name
+        shutil.rmtree(path, ignore_errors=True)
+        return None
+
+    @metrics.traced('compact_sales')
+    def compact_sales(self, min_bytes=0):
+        """Pasa a un segmento columnar las ventas del diario que aún no están compactadas.
+
+        No hace nada si la parte sin compactar no supera min_bytes. Con el candado
+        solo se lee la cola del diario y se escribe su segmento, así que el costo
+        no depende del historial. Después, sin el candado, se fusionan segmentos
+        (ver _merge_segments) y se borran los que ya no se usan. Pensado para
+        llamarse en segundo plano, fuera de la venta.
+        """
+        with self._lock:
+            if self.sales_journal_pending_bytes() <= min_bytes:
+                return
+            os.makedirs(self.sales_segments_dir, exist_ok=True)
+            segments, offset = self._sales_segments()
+            df, end = self._read_journal_from(offset)
+            if df.empty:
+                return
+            name = self._write_segment(df, offset, end)
+            if name is None:
+                return
+            self._write_journal_offset(self.sales_segments_meta_path, end, segments=segments + [[name, end]])
+        self._merge_segments()
+        self._remove_unused_segments()
+
+    def _merge_segments(self):
+        """Fusiona los dos últimos segmentos mientras el penúltimo no llegue al doble del último.
+
+        Así los tamaños crecen como potencias de dos: hay O(log n) segmentos y
+        cada venta se reescribe O(log n) veces. Los segmentos no cambian una vez
+        escritos, de modo que se leen y fusionan sin el candado; con él solo se
+        comprueba que sigan vigentes y se cambia el estado.
+        """
+        while True:
+            segments, _ = self._sales_segments()
+            ranges = self._segment_ranges(segments)
+            if len(ranges) < 2:
+                return
+            (first, start, middle), (second, _, end) = ranges[-2:]
+            if middle - start >= 2 * (end - middle):
+                return
+            parts = [self._read_segment(first, start, middle), self._read_segment(second, middle, end)]
+            if parts[0] is None or parts[1] is None:
+                return
+            name = self._write_segment(pd.concat(parts, ignore_index=True), start, end)
+            if name is None:
+                return
+            with self._lock:
+                current, offset = self._sales_segments()
+                if current[-2:] != segments[-2:]:
+                    # Otra terminal cambió los segmentos mientras tanto
+                    shutil.rmtree(os.path.join(self.sales_segments_dir, name), ignore_errors=True)
+                    return
+                self._write_journal_offset(self.sales_segments_meta_path, offset,
+                                           segments=current[:-2] + [[name, end]])
+                # La fecha marca desde cuándo no se usan (ver _remove_unused_segments)
+                for old in (first, second):
+                    os.utime(os.path.join(self.sales_segments_dir, old))
+
+    def _remove_unused_segments(self):
+        """Borra los segmentos que no están en el estado y no se tocaron en SALES_SEGMENT_GRACE_SECONDS."""
+        segments, _ = self._sales_segments()
+        used = {name for name, _ in segments}
+        limit = time.time() - SALES_SEGMENT_GRACE_SECONDS
+        for entry in os.scandir(self.sales_segments_dir):
+            if entry.is_dir() and entry.name not in used and entry.stat().st_mtime < limit:
+                shutil.rmtree(entry.path, ignore_errors=True)
+
+    def _rollup_path(self, month):
+        return os.path.join(self.rollups_dir, f'{month}.csv')
+
+    def _merge_rollups(self, sales_df):
+        """Suma líneas de venta a las particiones mensuales de acumulados diarios."""
+        if sales_df.empty:
+            return
+        daily = aggregate_daily(sales_df)
+        months = daily['fecha'].astype(str).str[:7]
+        for month, part in daily.groupby(months):
+            path = self._rollup_path(month)
+            if os.path.exists(path):
+                metrics.count_file(BYTES_READ, path)
+                part = aggregate_daily(pd.concat([pd.read_csv(path), part], ignore_index=True))
+            _write_csv_atomic(part.sort_values('fecha', kind='stable'), path)
+
+    def update_rollups(self):
+        """Lleva los acumulados diarios al día procesando solo las ventas nuevas del diario.
+
+        Con el candado tomado, para que dos llamadas simultáneas no sumen dos
+        veces las mismas ventas antes de que se guarde la marca.
+        """
+        with self._lock:
+            os.makedirs(self.rollups_dir, exist_ok=True)
+            offset = self._journal_offset(self.rollups_meta_path)
+            if offset == 0:
+                # Sin marca válida: se reconstruyen todas las particiones
+                for name in os.listdir(self.rollups_dir):
+                    if name.endswith('.csv'):
+                        os.remove(os.path.join(self.rollups_dir, name))
+                sales_df, end = self._load_sales_with_offset()
+            else:
+                sales_df, end = self._read_journal_from(offset)
+            self._merge_rollups(sales_df)
+            self._write_journal_offset(self.rollups_meta_path, end)
+
+    def daily_rollup(self, start, end):
+        """Totales por día y producto entre dos fechas 'AAAA-MM-DD' (inclusive)."""
+        parts = []
+        with self._lock:
+            self.update_rollups()
+            for month in pd.period_range(start[:7], end[:7], freq='M').strftime('%Y-%m'):
+                path = self._rollup_path(month)
+                if os.path.exists(path):
+                    metrics.count_file(BYTES_READ, path)
+                    parts.append(pd.read_csv(path))
+        if not parts:
+            return pd.DataFrame(columns=ROLLUP_COLUMNS)
+        df = pd.concat(parts, ignore_index=True)
+        df['fecha'] = df['fecha'].astype(str)
+        return df[(df['fecha'] >= start) & (df['fecha'] <= end)].reset_index(drop=True)
+
+    @contextmanager
+    def backup_sources(self):
+        """Da {nombre: (ruta, os.stat_result)} de los archivos a respaldar, tomados en un mismo instante.
+
+        Con el candado solo se crea un enlace duro a cada archivo y se anota su
+        estado, así que las ventas no esperan a que la copia se lea y comprima:
+        el inventario y la configuración se reemplazan enteros (el enlace conserva
+        la versión tomada) y al diario de ventas solo se le añaden líneas, del
+        que se respaldan los st_size bytes anotados. Si el sistema de archivos no
+        admite enlaces se copia el archivo.
+
+        Las instantáneas y los acumulados no se respaldan: se regeneran a partir de estos.
+        """
+        sources = {}
+        try:
+            with self._lock:
+                for path in (self.inventory_path, self.sales_path, self.config_path):
+                    if os.path.exists(path):
+                        sources[os.path.basename(path)] = (_pin_file(path), os.stat(path))
+            yield sources
+        finally:
+            for pinned, _ in sources.values():
+                os.remove(pinned)
+
+    def restore_files(self, files):
+        """Reemplaza los archivos de datos por los de una copia ({nombre: bloques de bytes})."""
+        with self._lock:
+            for name, parts in files.items():
+                _write_stream_atomic(parts, os.path.join(self.data_dir, name))
+            # Las marcas de avance sobre el diario ya no valen: se reconstruyen al leer
+            for path in (self.sales_segments_meta_path, self.rollups_meta_path):
+                if os.path.exists(path):
+                    os.remove(path)
+
+    def export_inventory(self, path):
+        """Copia el inventario a un CSV externo."""
+        with open(self.inventory_path, 'rb') as src, open(path, 'wb') as dst:
+            shutil.copyfileobj(src, dst)
+        metrics.count_file(BYTES_READ, path)
+        metrics.count_file(BYTES_WRITTEN, path)
+
+    def export_sales(self, path):
+        """Copia el registro de ventas a un CSV externo."""
+        with open(self.sales_path, 'rb') as src, open(path, 'wb') as dst:
+            shutil.copyfileobj(src, dst)
+        metrics.count_file(BYTES_READ, path)
+        metrics.count_file(BYTES_WRITTEN, path)
+
+class SqliteStorage:
+    """Almacenamiento en una base SQLite en modo WAL.
+
+    Cada hilo usa su propia conexión. Las escrituras tocan solo las filas
+    afectadas y una venta (descuento de stock más líneas) es una única transacción.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS productos (
+            id_producto INTEGER PRIMARY KEY,
+            nombre TEXT NOT NULL,
+            precio REAL NOT NULL,
+            stock INTEGER NOT NULL,
+            precio_venta REAL,
+            porcentaje_incremento REAL,
+            categoria TEXT,
+            codigo_barras TEXT
+        );
+        CREATE INDEX IF NOT EXISTS idx_productos_nombre ON productos(nombre);
+        CREATE TABLE IF NOT EXISTS ventas (
+            id_venta INTEGER PRIMARY KEY AUTOINCREMENT,
+            fecha TEXT NOT NULL,
+            id_producto INTEGER NOT NULL,
+            nombre TEXT,
+            cantidad INTEGER NOT NULL,
+            total REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_ventas_fecha ON ventas(fecha);
+        CREATE INDEX IF NOT EXISTS idx_ventas_producto ON ventas(id_producto);
+        CREATE TABLE IF NOT EXISTS ventas_diarias (
+            fecha TEXT NOT NULL,
+            id_producto INTEGER NOT NULL,
+            nombre TEXT,
+            cantidad INTEGER NOT NULL,
+            total REAL NOT NULL,
+            PRIMARY KEY (fecha, id_producto)
+        ) WITHOUT ROWID;
+        CREATE TABLE IF NOT EXISTS config (
+            parametro TEXT PRIMARY KEY,
+            valor
+        );
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._local = threading.local()
+        self._lock = FileLock(db_path + '.lock')
+        with self._connection() as conn:
+            conn.executescript(self.SCHEMA)
+            existing = {row[1] for row in conn.execute('PRAGMA table_info(productos)')}
+            for column in OPTIONAL_INVENTORY_COLUMNS:
+                if column not in existing:
+                    conn.execute(f'ALTER TABLE productos ADD COLUMN {column} TEXT')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_productos_codigo ON productos(codigo_barras)')
+            missing_rollups = conn.execute(
+                'SELECT EXISTS(SELECT 1 FROM ventas) AND NOT EXISTS(SELECT 1 FROM ventas_diarias)'
+            ).fetchone()[0]
+            if missing_rollups:
+                self._rebuild_rollups(conn)
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def lock(self):
+        """Candado compartido por todas las terminales que usan esta base."""
+        return self._lock
+
+    def load_config(self):
+        """Carga la configuración desde la tabla config."""
+        df = pd.read_sql_query('SELECT parametro, valor FROM config', self._connection())
+        if df.empty:
+            df = pd.DataFrame(DEFAULT_CONFIG)
+            self.save_config(df)
+        return df
+
+    def save_config(self, df):
+        """Guarda los parámetros de configuración."""
+        with self._connection() as conn:
+            conn.executemany(
+                'INSERT INTO config (parametro, valor) VALUES (?, ?) '
+                'ON CONFLICT(parametro) DO UPDATE SET valor = excluded.valor',
+                df[['parametro', 'valor']].itertuples(index=False, name=None)
+            )
+
+    def config_version(self):
+        """Marca que cambia con cada escritura en la base (incluida la de otros procesos)."""
+        return self.inventory_version()
+
+    def inventory_version(self):
+        """Marca que cambia con cada escritura en la base (incluida la de otros procesos)."""
+        version = []
+        for path in (self.db_path, self.db_path + '-wal'):
+            try:
+                st = os.stat(path)
+                version.append((st.st_mtime_ns, st.st_size))
+            except FileNotFoundError:
+                version.append(None)
+        return tuple(version)
+
+    def load_inventory(self):
+        """Carga la tabla de productos con los tipos compactos."""
+        return typed_inventory(pd.read_sql_query(
+            f"SELECT {', '.join(INVENTORY_COLUMNS + OPTIONAL_INVENTORY_COLUMNS)} FROM productos ORDER BY rowid",
+            self._connection()
+        ))
+
+    def _upsert_products(self, conn, df):
+        df = inventory_for_disk(df)
+        columns = [c for c in INVENTORY_COLUMNS + OPTIONAL_INVENTORY_COLUMNS if c in df.columns]
+        updates = ', '.join(f'{c} = excluded.{c}' for c in columns if c != 'id_producto')
+        conn.executemany(
+            f"INSERT INTO productos ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))}) "
+            f"ON CONFLICT(id_producto) DO UPDATE SET {updates}",
+            df[columns].astype(object).itertuples(index=False, name=None)
+        )
+
+    @metrics.traced('save_inventory')
+    def save_inventory(self, df):
+        """Reemplaza la tabla de productos completa."""
+        with self._connection() as conn:
+            conn.execute('DELETE FROM productos')
+            self._upsert_products(conn, df)
+
+    def update_products(self, df, changed_ids):
+        """Inserta o actualiza solo los productos indicados."""
+        changed = df[df['id_producto'].isin(list(changed_ids))]
+        with self._connection() as conn:
+            self._upsert_products(conn, changed)
+
+    def update_prices(self, df, changed_ids):
+        """Actualiza solo precio_venta de los productos indicados, en una transacción."""
+        changed = df[df['id_producto'].isin(list(changed_ids))]
+        with self._connection() as conn:
+            conn.executemany(
+                'UPDATE productos SET precio_venta = ? WHERE id_producto = ?',
+                zip(from_cents(changed['precio_venta']).tolist(), changed['id_producto'].tolist())
+            )
+
+    def checkout(self, inventory_df, sale_rows):
+        """Descuenta stock e inserta las líneas de venta en una sola transacción.
+
+        Cada descuento solo se aplica si queda stock suficiente; si alguno no
+        puede aplicarse se deshace la venta entera y se lanza ValueError.
+        """
+        with self._connection() as conn:
+            for row in sale_rows:
+                updated = conn.execute(
+                    'UPDATE productos SET stock = stock - ? WHERE id_producto = ? AND stock >= ?',
+                    (row['cantidad'], int(row['id_producto']), row['cantidad'])
+                ).rowcount
+                if not updated:
+                    raise ValueError(f"Stock insuficiente de {row['nombre']}")
+            self._insert_sales(conn, sale_rows)
+
+    def _insert_sales(self, conn, rows):
+        values = [tuple(row[col] for col in SALES_COLUMNS) for row in rows]
+        conn.executemany(
+            f"INSERT INTO ventas ({', '.join(SALES_COLUMNS)}) VALUES ({', '.join('?' * len(SALES_COLUMNS))})",
+            values
+        )
+        conn.executemany(
+            'INSERT INTO ventas_diarias (fecha, id_producto, nombre, cantidad, total) VALUES (?, ?, ?, ?, ?) '
+            'ON CONFLICT(fecha, id_producto) DO UPDATE SET nombre = excluded.nombre, '
+            'cantidad = cantidad + excluded.cantidad, total = total + excluded.total',
+            values
+        )
+
+    def _rebuild_rollups(self, conn):
+        conn.execute('DELETE FROM ventas_diarias')
+        conn.execute(
+            'INSERT INTO ventas_diarias (fecha, id_producto, nombre, cantidad, total) '
+            'SELECT fecha, id_producto, MAX(nombre), SUM(cantidad), SUM(total) '
+            'FROM ventas GROUP BY fecha, id_producto'
+        )
+
+    def compact_sales(self, min_bytes=0):
+        """Las ventas ya están en la base: no hay diario que compactar."""
+
+    def update_rollups(self):
+        """Los acumulados se actualizan en la misma transacción que cada venta."""
+
+    def daily_rollup(self, start, end):
+        """Totales por día y producto entre dos fechas 'AAAA-MM-DD' (inclusive)."""
+        return pd.read_sql_query(
+            f"SELECT {', '.join(ROLLUP_COLUMNS)} FROM ventas_diarias WHERE fecha BETWEEN ? AND ? ORDER BY fecha",
+            self._connection(), params=(start, end)
+        )
+
+    @metrics.traced('load_sales')
+    def load_sales(self):
+        """Carga el registro de ventas."""
+        return pd.read_sql_query(
+            f"SELECT {', '.join(SALES_COLUMNS)} FROM ventas ORDER BY id_venta",
+            self._connection()
+        )
+
+    def save_sales(self, df):
+        """Reemplaza el registro de ventas completo."""
+        with self._connection() as conn:
+            conn.execute('DELETE FROM ventas')
+            conn.execute('DELETE FROM ventas_diarias')
+            self._insert_sales(conn, df[SALES_COLUMNS].to_dict('records'))
+
+    def append_sales(self, rows):
+        """Inserta líneas de venta."""
+        with self._connection() as conn:
+            self._insert_sales(conn, rows)
+
+    @contextmanager
+    def backup_sources(self):
+        """Da {nombre: (ruta, os.stat_result)} con una copia coherente de la base, hecha con la API de copia de SQLite."""
+        tmp_path = self.db_path + '.backup'
+        target = sqlite3.connect(tmp_path)
+        try:
+            self._connection().backup(target)
+        finally:
+            target.close()
+        try:
+            yield {os.path.basename(self.db_path): (tmp_path, os.stat(tmp_path))}
+        finally:
+            os.remove(tmp_path)
+
+    def restore_files(self, files):
+        """Reemplaza el contenido de la base por el de una copia ({nombre: bloques de bytes}).
+
+        Se copia dentro de la base abierta, así que las conexiones siguen siendo válidas.
+        """
+        parts = files.get(os.path.basename(self.db_path))
+        if parts is None:
+            return
+        tmp_path = self.db_path + '.restore'
+        _write_stream_atomic(parts, tmp_path)
+        try:
+            with self._lock:
+                source = sqlite3.connect(tmp_path)
+                try:
+                    source.backup(self._connection())
+                finally:
+                    source.close()
+        finally:
+            os.remove(tmp_path)
+
+    def export_inventory(self, path):
+        """Exporta los productos a un CSV."""
+        inventory_for_disk(self.load_inventory()).to_csv(path, index=False)
+
+    def export_sales(self, path):
+        """Exporta el registro de ventas a un CSV."""
+        self.load_sales().to_csv(path, index=False)
+
+def import_csv_data(source, target):
+    """Copia inventario, ventas y configuración de un CsvStorage a un SqliteStorage en una transacción."""
+    inventory_df = source.load_inventory()
+    sales_df = source.load_sales()
+    config_df = source.load_config()
+    with target._connection() as conn:
+        conn.execute('DELETE FROM productos')
+        conn.execute('DELETE FROM ventas')
+        conn.execute('DELETE FROM ventas_diarias')
+        conn.execute('DELETE FROM config')
+        target._upsert_products(conn, inventory_df)
+        target._insert_sales(conn, sales_df[SALES_COLUMNS].to_dict('records'))
+        conn.executemany(
+            'INSERT INTO config (parametro, valor) VALUES (?, ?)',
+            config_df[['parametro', 'valor']].itertuples(index=False, name=None)
+        )
+
+def open_storage(data_dir):
+    """Usa la base SQLite si existe en la carpeta de datos; si no, los CSV."""
+    db_path = os.path.join(data_dir, 'inventario.db')
+    if os.path.exists(db_path):
+        return SqliteStorage(db_path)
+    return CsvStorage(data_dir)
+
+if __name__ == '__main__':
+    # Uso: python storage.py [carpeta_de_datos]
+    data_dir = sys.argv[1] if len(sys.argv) > 1 else 'data'
+    import_csv_data(CsvStorage(data_dir), SqliteStorage(os.path.join(data_dir, 'inventario.db')))
+    print(f"Datos importados en {os.path.join(data_dir, 'inventario.db')}")